@@ -0,0 +1,115 @@
+# Streaming aggregation of simulation results
+# The plots only need, for each grid point (token interval or decade), the mean over all simulations and the
+# boundaries of the areas into which 90% and 98% of the simulations fall (conf_int in the plot scripts).
+# Instead of storing every row of every simulation, StreamingBands keeps running means and variances, and for the
+# boundaries an exact buffer with the smallest and the largest values at each grid point - only as many values as the
+# order statistics of the requested levels need, and never more than the number of simulations added so far (so that the
+# aggregate of a chunk of simulations stays small). Aggregates of separate runs (or chunks) can be merged; the buffers
+# grow with the merged simulations up to the size needed for capacity simulations.
+# NaN values (e.g. Pneo values of decades without types) are left out.
+
+import numpy as np
+
+import bands
+
+
+# the number of values that have to be kept at each end to find the boundaries for up to capacity simulations
+def tail_size(capacity, levels):
+    return max([capacity - positions[1] for positions in (bands.conf_positions(capacity, conf) for conf in levels) if positions] + [1])
+
+
+class StreamingBands:
+    # nr_points: number of grid points; levels: the confidence levels; capacity: the maximum number of simulations
+    # that will be aggregated (this determines the size of the buffers)
+    def __init__(self, nr_points, levels=(0.9, 0.98), capacity=100000):
+        self.levels = tuple(levels)
+        self.capacity = capacity
+        self.count = np.zeros(nr_points, dtype=np.int64)
+        self.mean_values = np.zeros(nr_points)
+        self.m2 = np.zeros(nr_points)
+        self.size = tail_size(capacity, levels)
+        self.low = np.full((0, nr_points), np.inf)    # the smallest values (not sorted)
+        self.high = np.full((0, nr_points), -np.inf)  # the largest values (not sorted)
+
+    def empty_like(self):
+        return StreamingBands(len(self.count), self.levels, self.capacity)
+
+    # add a batch of simulation results (one row per simulation, one column per grid point)
+    def update(self, batch):
+        batch = np.atleast_2d(np.asarray(batch, dtype=float))
+        valid = ~np.isnan(batch)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, batch, 0).sum(axis=0) / count
+            m2 = np.where(valid, (batch - mean) ** 2, 0).sum(axis=0)
+        self._merge_moments(count, np.nan_to_num(mean), m2)
+        self.low = self._keep(np.concatenate((self.low, np.where(valid, batch, np.inf))), smallest=True)
+        self.high = self._keep(np.concatenate((self.high, np.where(valid, batch, -np.inf))), smallest=False)
+        return self
+
+    # merge another aggregate (with the same grid, levels and capacity) into this one
+    def merge(self, other):
+        if other.levels != self.levels or other.capacity != self.capacity or other.count.shape != self.count.shape:
+            raise ValueError("only aggregates with the same grid, levels and capacity can be merged")
+        self._merge_moments(other.count, other.mean_values, other.m2)
+        self.low = self._keep(np.concatenate((self.low, other.low)), smallest=True)
+        self.high = self._keep(np.concatenate((self.high, other.high)), smallest=False)
+        return self
+
+    # parallel update of counts, means and sums of squared deviations (Chan et al.)
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean_values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(total > 0, count / total, 0)
+        self.mean_values = self.mean_values + delta * share
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.count = total
+
+    def _keep(self, values, smallest):
+        size = min(self.size, values.shape[0])
+        if not smallest:
+            values = -values
+        if size > 0:
+            values = np.partition(values, size - 1, axis=0)[:size]
+        return values if smallest else -values
+
+    def mean(self):
+        with np.errstate(invalid='ignore'):
+            return np.where(self.count > 0, self.mean_values, np.nan)
+
+    def variance(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    # the lower and upper boundary for a confidence level at each grid point (NaN where there is no boundary)
+    def bounds(self, conf):
+        lower = np.full(len(self.count), np.nan)
+        upper = np.full(len(self.count), np.nan)
+        low = np.sort(self.low, axis=0)
+        high = -np.sort(-self.high, axis=0)
+        for point, count in enumerate(self.count):
+            positions = bands.conf_positions(int(count), conf)
+            if positions is None:
+                continue
+            conf_min, conf_max = positions
+            if conf_min >= len(low) or count - 1 - conf_max >= len(high):
+                raise ValueError("more simulations (%d) than the capacity of the aggregate (%d)" % (count, self.capacity))
+            lower[point] = low[conf_min, point]
+            upper[point] = high[count - 1 - conf_max, point]
+        return lower, upper
+
+    def save(self, file):
+        np.savez(file, levels=np.asarray(self.levels), capacity=self.capacity, count=self.count,
+                 mean_values=self.mean_values, m2=self.m2, low=self.low, high=self.high)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            result = cls.__new__(cls)
+            result.levels = tuple(data['levels'].tolist())
+            result.capacity = int(data['capacity'])
+            result.size = tail_size(result.capacity, result.levels)
+            for name in ('count', 'mean_values', 'm2', 'low', 'high'):
+                setattr(result, name, data[name])
+        return result
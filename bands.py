@@ -0,0 +1,137 @@
+# Confidence bands for the plot scripts (plot_1_CLLT.py, plot_2_CLLT.py, plot_4_CLLT.py, plot_5_CLLT.py)
+# The bands are the areas into which a given share (conf) of the simulations fall: for each grid point (token interval or decade),
+# the simulation values are put in ascending order and the conf_min-th and conf_max-th value serve as lower and upper boundary.
+# All levels are computed in one pass with a partial sort (np.partition) along the simulation axis.
+# NaN values (Pneo values of decades without types) are left out: the positions are determined from the number of
+# valid values at each grid point.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregate
+import results_io
+
+
+# the positions of the lower and upper boundary in an ascending list of nr_sim values.
+# example: p = 0.9, nr_sim = 1000. conf_max = 899: in an ascending list of values, the 899th of 1,000 values is the upper
+# boundary; conf_min = 1000 - 899 - 1 = 100. if conf_max is equal to or below zero, there is no boundary (None)
+def conf_positions(nr_sim, conf):
+    conf_max = int(round(nr_sim * conf - 1))
+    conf_min = nr_sim - conf_max - 1
+    if conf_max <= 0:
+        return None
+    return conf_min, conf_max
+
+
+# load simulation results, given the name of the csv file: the binary file written by the simulation scripts (same name,
+# ending in .bin; only the selected columns are read) or the csv file with one row per simulation if there is no binary file,
+# or the aggregate that the simulation scripts write in aggregation mode (same name, ending in _bands.npz).
+# If there are both simulations and an aggregate (e.g. after a run in aggregation mode), the newer file is loaded.
+def load(path, columns=None):
+    base = os.path.splitext(path)[0]
+    sims_file = next((file for file in (base + '.bin', path) if os.path.exists(file)), None)
+    bands_file = base + '_bands.npz'
+    if sims_file is None or (os.path.exists(bands_file) and os.path.getmtime(bands_file) > os.path.getmtime(sims_file)):
+        return aggregate.StreamingBands.load(bands_file)
+    if sims_file.endswith('.bin'):
+        return results_io.read_results(sims_file).to_frame(columns)
+    sims = pd.read_csv(sims_file, sep = ",", index_col = 0)
+    return sims if columns is None else sims[[str(column) for column in columns]]
+
+
+# the mean of the simulations at each grid point (NaN values are skipped)
+def mean(sims):
+    if isinstance(sims, aggregate.StreamingBands):
+        return sims.mean()
+    values = np.asarray(sims, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(values, axis=0) if np.isnan(values).any() else values.mean(axis=0)
+
+
+# the lower and upper boundaries of all levels: a dictionary level -> (lower, upper), each an array with one value per grid point.
+# sims is a table with one row per simulation and one column per grid point, or an aggregate.StreamingBands
+def conf_bands(sims, levels=(0.98, 0.9)):
+    if isinstance(sims, aggregate.StreamingBands):
+        return {conf: sims.bounds(conf) for conf in levels}
+
+    values = np.asarray(sims, dtype=float)
+    nr_sim, nr_points = values.shape
+    valid = nr_sim - np.isnan(values).sum(axis=0)  # NaN values are sorted to the end by np.partition
+
+    positions = {}
+    for count in np.unique(valid):
+        for conf in levels:
+            positions[(count, conf)] = conf_positions(int(count), conf)
+    kth = sorted({p for pair in positions.values() if pair for p in pair})
+    # partition the transposed table (one contiguous row per grid point), which is faster than partitioning along the columns
+    ordered = np.array(values.T, order="C")
+    if kth:
+        ordered.partition(kth, axis=1)
+
+    result = {}
+    points = np.arange(nr_points)
+    for conf in levels:
+        lower = np.full(nr_points, np.nan)
+        upper = np.full(nr_points, np.nan)
+        for count in np.unique(valid):
+            pair = positions[(count, conf)]
+            if pair is None:
+                continue
+            columns = points[valid == count]
+            lower[columns] = ordered[columns, pair[0]]
+            upper[columns] = ordered[columns, pair[1]]
+        result[conf] = (lower, upper)
+    return result
+
+
+# the Monte Carlo standard errors of the mean and of the boundaries of all levels at each grid point: a dictionary with the
+# key 'mean' (an array) and one key per level -> (lower, upper). The standard error of the mean is the standard deviation
+# divided by the square root of the number of valid values. For a boundary, i.e. the k-th of n ordered values, the rank
+# of the corresponding quantile varies by sqrt(n p (1-p)) from sample to sample (p = (k+1)/n); half the distance between
+# the values that far below and above the k-th value is the standard error (distribution-free, as for a median).
+def mc_errors(sims, levels=(0.98, 0.9)):
+    values = np.asarray(sims, dtype=float)
+    nr_sim, nr_points = values.shape
+    valid = nr_sim - np.isnan(values).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        deviation = values - np.nansum(values, axis=0) / valid
+        variance = np.nansum(deviation ** 2, axis=0) / (valid - 1)
+        errors = {'mean': np.where(valid > 1, np.sqrt(variance / valid), np.nan)}
+    ordered = np.sort(values, axis=0)  # NaN values are sorted to the end
+    points = np.arange(nr_points)
+
+    def rank_error(k, count):
+        spread = np.sqrt(count * ((k + 1) / count) * (1 - (k + 1) / count))
+        below = np.clip(np.floor(k - spread).astype(int), 0, count - 1)
+        above = np.clip(np.ceil(k + spread).astype(int), 0, count - 1)
+        return (ordered[above, points] - ordered[below, points]) / 2
+
+    for conf in levels:
+        lower = np.full(nr_points, np.nan)
+        upper = np.full(nr_points, np.nan)
+        counts = np.maximum(valid, 1)
+        positions = [conf_positions(int(count), conf) for count in valid]
+        has = np.array([pair is not None for pair in positions])
+        if has.any():
+            conf_min = np.array([pair[0] if pair else 0 for pair in positions])
+            conf_max = np.array([pair[1] if pair else 0 for pair in positions])
+            lower[has] = rank_error(conf_min, counts)[has]
+            upper[has] = rank_error(conf_max, counts)[has]
+        errors[conf] = (lower, upper)
+    return errors
+
+
+# the largest standard error (of the mean and of all boundaries) over all grid points
+def max_error(errors):
+    values = np.concatenate([errors['mean']] + [bound for key, pair in errors.items() if key != 'mean' for bound in pair])
+    values = values[~np.isnan(values)]
+    return values.max() if len(values) else np.inf
+
+
+# fill the areas between the boundaries of each level; colours: a dictionary level -> colour
+def fill_bands(plot_x, x, conf_bands, colours, **kwargs):
+    for conf, colour in colours.items():
+        lower, upper = conf_bands[conf]
+        plot_x.fill_between(x, lower, upper, facecolor=colour, alpha=0.5, **kwargs)
@@ -0,0 +1,168 @@
+# Benchmarks for the simulation and plotting hot paths
+# The script times the stages of the Säily and the Pneo simulations on the shipped data and on scaled copies of it
+# (each text and its occurrences copied factor times, with part of the lemmas renamed in each copy, so that the number
+# of texts, occurrences and types grows):
+#   saily_index      building the text -> lemma index from the list of occurrences
+#   saily_curves     shuffling the texts and counting the types after each text (saily_engine.type_curves)
+#   saily_interp     interpolating these curves at the xnew intervals (interp1d, as in the non-fused mode)
+#   saily_fused      shuffling and projecting directly onto xnew (saily_engine.grid_curves, the default mode)
+#   pneo_index       building the sparse lemma x text count matrix
+#   pneo_resample    drawing the re-sampled sub-corpora (shuffle_dec in the original scripts)
+#   pneo_counts      the first decade and the number of (new) types per decade (pivot and find_min in the original scripts)
+#   conf_bands       the mean and the 90%/98% boundaries of the simulations (conf_int in the original plot scripts)
+# For each stage, the time, the number of simulations per second, the peak memory allocated during the stage (measured with
+# tracemalloc in one extra run that is not timed) and the peak memory (RSS) of the process so far (metrics.peak_rss_mb)
+# are written to a JSON file in data/benchmarks, together with the versions and the commit, so that runs of different
+# versions can be compared (parameter compare_with).
+
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import scipy
+from scipy.interpolate import interp1d
+
+import bands
+import ingest
+import metrics
+import pneo_engine
+import saily_engine
+import text_index
+
+# set parameters
+nr_sim = 256               # nr of simulations per stage
+batch_size = 64            # nr of simulations evaluated together
+repeats = 3                # every stage is timed this many times; the fastest run is reported
+scales = [1, 4]            # the corpora are copied this many times (1: the shipped data)
+seed = 1                   # seed of the random numbers (the same for every run, so that runs are comparable)
+saily_data = ('data/dta_texts_18c.csv', 'data/isch_18c.csv')  # the list of texts and of occurrences for the Säily stages
+pneo_data = ('data/texts_dta.csv', 'data/isch.csv')            # the same for the Pneo stages
+decs = range(1490,1910,10) # decades in the corpus
+decs_result = range(1800,1910,10) # decades of interest
+target_size = 4000000      # maximum corpus size per decade (scaled with the corpus)
+output_dir = 'data/benchmarks' # the results are saved here
+compare_with = None        # the name of an earlier result file: the times of both runs are printed side by side
+
+
+# copy the texts and the occurrences factor times; in every copy, half of the lemmas get a new name
+def scaled_corpus(texts, occurrences, factor, rng):
+    if factor == 1:
+        return texts, occurrences
+    lemmas = pd.unique(np.asarray(occurrences['Lemma'], dtype=object))
+    texts_copies, occurrences_copies = [texts], [occurrences[['Dekade', 'Lemma', 'Datei']]]
+    for copy in range(1, factor):
+        renamed = set(rng.choice(lemmas, len(lemmas) // 2, replace=False))
+        texts_copy = texts.assign(Datei = texts['Datei'].astype(str) + '_%d' % copy)
+        lemma = np.asarray(occurrences['Lemma'], dtype=object)
+        lemma = np.where(pd.Series(lemma).isin(renamed), pd.Series(lemma).astype(str) + '_%d' % copy, lemma)
+        occurrences_copy = pd.DataFrame({'Dekade': occurrences['Dekade'].values, 'Lemma': lemma,
+                                         'Datei': np.asarray(occurrences['Datei'], dtype=object).astype(str) + '_%d' % copy})
+        texts_copies.append(texts_copy)
+        occurrences_copies.append(occurrences_copy)
+    return pd.concat(texts_copies, ignore_index=True), pd.concat(occurrences_copies, ignore_index=True)
+
+
+# the peak memory allocated by Python and NumPy while the function runs, above the memory allocated before it
+def stage_peak_mb(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+# time a stage: the fastest of repeats runs; returns the result of the last run
+def measure(results, corpus, stage, function, nr_sim=None):
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        value = function()
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+    stage_mb = stage_peak_mb(function)
+    results.append({'corpus': corpus, 'stage': stage, 'seconds': seconds,
+                    'sims_per_second': nr_sim / seconds if nr_sim else None, 'stage_peak_mb': stage_mb,
+                    'process_peak_rss_mb': metrics.peak_rss_mb()['process']})  # this and all earlier stages
+    print("%-12s %-14s %9.4f s %s %9.1f MB" % (corpus, stage, seconds, "%10.1f sims/s" % (nr_sim / seconds) if nr_sim else " " * 16, stage_mb))
+    return value
+
+
+def saily_stages(results, corpus, texts, occurrences):
+    xnew = np.arange(0, int(texts['Freq'].sum()), 100000)
+    index = measure(results, corpus, 'saily_index', lambda: text_index.TextIndex.from_occurrences(texts, occurrences).saily_index())
+    perms = saily_engine.permutations(np.random.default_rng(seed), nr_sim, index.nr_texts)
+
+    def curves():
+        return [saily_engine.type_curves(index, perms[n:n + batch_size]) for n in range(0, nr_sim, batch_size)]
+    batches = measure(results, corpus, 'saily_curves', curves, nr_sim)
+
+    def interpolate():
+        return [interp1d(tokens, types)(xnew).astype(int) for types_batch, tokens_batch in batches
+                for types, tokens in zip(types_batch, tokens_batch)]
+    measure(results, corpus, 'saily_interp', interpolate, nr_sim)
+
+    def fused():
+        return np.concatenate([saily_engine.grid_curves(index, perms[n:n + batch_size], xnew) for n in range(0, nr_sim, batch_size)])
+    sims = measure(results, corpus, 'saily_fused', fused, nr_sim)
+    measure(results, corpus, 'conf_bands', lambda: (bands.mean(sims), bands.conf_bands(sims, (0.98, 0.9))), nr_sim)
+
+
+def pneo_stages(results, corpus, texts, occurrences, factor):
+    index = measure(results, corpus, 'pneo_index', lambda: pneo_engine.PneoIndex.from_frames(texts, occurrences))
+    resampler = pneo_engine.DecadeResampler(texts, decs, target_size * factor, index.files)
+    fixed = pneo_engine.FixedPart(index, resampler)
+    keys = resampler.random_keys(np.random.default_rng(seed), nr_sim)
+
+    def resample():
+        return [resampler.draw(None, keys=keys[n:n + batch_size]) for n in range(0, nr_sim, batch_size)]
+    masks = measure(results, corpus, 'pneo_resample', resample, nr_sim)
+    sims = measure(results, corpus, 'pneo_counts',
+                   lambda: np.concatenate([pneo_engine.pneo(index, mask, decs_result, fixed) for mask in masks]), nr_sim)
+    measure(results, corpus, 'conf_bands', lambda: (bands.mean(sims), bands.conf_bands(sims, (0.98, 0.9))), nr_sim)
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(seed)
+    results = []
+    saily_texts = pd.read_csv(saily_data[0], sep = ',')
+    saily_occurrences = ingest.read_table(saily_data[1])
+    pneo_texts = pd.read_csv(pneo_data[0], sep = ',')
+    pneo_occurrences = ingest.read_table(pneo_data[1])
+    for factor in scales:
+        texts, occurrences = scaled_corpus(saily_texts, saily_occurrences, factor, rng)
+        saily_stages(results, 'saily_x%d' % factor, texts, occurrences)
+        texts, occurrences = scaled_corpus(pneo_texts, pneo_occurrences, factor, rng)
+        pneo_stages(results, 'pneo_x%d' % factor, texts, occurrences, factor)
+
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'scipy': scipy.__version__, 'pandas': pd.__version__, 'cpus': os.cpu_count(),
+              'params': {'nr_sim': nr_sim, 'batch_size': batch_size, 'repeats': repeats, 'scales': scales, 'seed': seed,
+                         'saily_data': saily_data, 'pneo_data': pneo_data, 'target_size': target_size},
+              'results': results}
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, 'benchmark_%s.json' % time.strftime('%Y%m%d_%H%M%S'))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print("results saved to", path)
+
+    if compare_with:
+        with open(compare_with, encoding='utf-8') as f:
+            earlier = {(r['corpus'], r['stage']): r['seconds'] for r in json.load(f)['results']}
+        print("%-12s %-14s %10s %10s %8s" % ('corpus', 'stage', 'earlier', 'now', 'ratio'))
+        for r in results:
+            before = earlier.get((r['corpus'], r['stage']))
+            if before:
+                print("%-12s %-14s %9.4fs %9.4fs %8.2f" % (r['corpus'], r['stage'], before, r['seconds'], r['seconds'] / before))
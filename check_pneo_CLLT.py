@@ -0,0 +1,100 @@
+# Regression check of the Pneo engine against the original algorithm
+# pneo_engine.py replaces shuffle_dec, the pivot table and find_min of the original Monte Carlo scripts. The Pneo values
+# must stay exactly the same, so this script runs both on the same sub-corpora and compares them:
+#   1. the sub-corpora drawn by DecadeResampler.draw are compared with those of shuffle_dec, where the shuffled order of
+#      the texts of each decade (sample(frac = 1) in the original) is the order of the random keys of the resampler
+#   2. the Pneo values of pneo_engine.pneo, with and without FixedPart, are compared with those of the pivot table and
+#      find_min for every sub-corpus
+# The values must be equal (NaN where a decade has no types at all); the script stops with an error at the first difference.
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import pneo_engine
+
+# set parameters
+nr_sim = 10                # nr of sub-corpora per pattern
+patterns = {'isch': ('data/isch.csv', ';'), 'tum': ('data/tum.csv', ',')} # the lists of occurrences and their separators
+decs = range(1490,1910,10) # decades in the corpus
+decs_result = range(1800,1910,10) # decades of interest
+target_size = 4000000      # maximum corpus size per decade
+seed = 1                   # seed of the random keys
+
+texts_dta  = pd.read_csv('data/texts_dta.csv', sep= ',') # this file contains a line for each text in the corpus, together with the respective decade and the token count
+tokens_tot = pd.pivot_table(texts_dta, index = "Dekade", values = "Freq", aggfunc="sum")
+
+
+# shuffle_dec of the original scripts; the texts of a re-sampled decade are taken in the order given by order
+# (the rows of texts_dta of this decade) instead of a new sample(frac = 1)
+def shuffle_dec(decade, order):
+    real_size = int(tokens_tot.loc[decade, "Freq"])
+    if real_size <= target_size:
+        return texts_dta.loc[texts_dta.Dekade == decade]
+    else:
+        texts_dec = texts_dta.loc[order]
+        j = 1
+        counter = 0
+        while counter < target_size:
+            counter = texts_dec.iloc[0:j,2].sum()
+            j += 1
+        return texts_dec.iloc[0:j,:]
+
+
+# the following function finds the earliest attestation (the leftmost non-zero value in a series)
+def find_min(series):
+    mask = series > 0
+    return(series.loc[mask].index[0])
+
+
+# the following function returns (for a given decade) the number of lemmas that are not zero
+def find_types(df, dec):
+    if dec in df.columns.values:
+        return np.nansum(df[dec] > 0)
+    else:
+        return 0
+
+
+# the Pneo values of one sub-corpus, computed with the pivot table as in the original scripts
+def pivot_pneo(suffix_raw, sub_corpus):
+    suffix_sub = suffix_raw[suffix_raw['Datei'].isin(sub_corpus['Datei'])].loc[:,['Dekade', 'Lemma']]
+    suffix_sub["Wert"] = 1
+    suffix_x = pd.pivot_table(suffix_sub, index = 'Lemma', columns = 'Dekade', aggfunc = 'count', fill_value=0)
+    suffix_x.columns = list(suffix_x.columns.get_level_values(1))
+    suffix_x["min"] = suffix_x.apply(find_min, axis = 1)
+    new_types = suffix_x["min"][suffix_x["min"] > 1790].value_counts()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.array([np.float64(new_types.get(dec, 0)) / find_types(suffix_x, dec) for dec in decs_result])
+
+
+# compare two arrays of Pneo values (or masks); NaN is equal to NaN
+def check(name, expected, actual):
+    if expected.shape != actual.shape or not np.array_equal(expected, actual, equal_nan=expected.dtype.kind == 'f'):
+        raise SystemExit("%s: the values differ\nexpected: %s\nactual:   %s" % (name, expected, actual))
+
+
+rng = np.random.default_rng(seed)
+for pattern, (path, sep) in patterns.items():
+    suffix_raw = ingest.read_table(path, sep = sep)
+    suffix_raw = suffix_raw.assign(Datei = suffix_raw['Datei'].astype(object), Lemma = suffix_raw['Lemma'].astype(object))
+    index = pneo_engine.PneoIndex.from_frames(texts_dta, suffix_raw)
+    resampler = pneo_engine.DecadeResampler(texts_dta, decs, target_size, index.files)
+    fixed = pneo_engine.FixedPart(index, resampler)
+
+    # the same random keys for the resampler and for shuffle_dec: within a decade, the texts are taken in the order of their keys
+    keys = resampler.random_keys(rng, nr_sim)
+    masks = resampler.draw(rng, keys=keys)
+    expected_masks, expected_pneo = [], []
+    for n in range(nr_sim):
+        orders = {}
+        for group, decade in enumerate(np.unique(texts_dta['Dekade'].values[resampler.rows])):
+            in_group = np.nonzero(resampler.group == group)[0]
+            orders[decade] = resampler.rows[in_group[np.argsort(keys[n, in_group], kind='stable')]]
+        sub_corpus = pd.concat([shuffle_dec(dec, orders.get(dec)) for dec in decs if dec in tokens_tot.index], axis=0)
+        expected_masks.append(sub_corpus['Datei'])
+        expected_pneo.append(pivot_pneo(suffix_raw, sub_corpus))
+
+    check(pattern + ' sub-corpora', index.file_mask(expected_masks), masks)
+    check(pattern + ' pneo', np.array(expected_pneo), pneo_engine.pneo(index, masks, decs_result))
+    check(pattern + ' pneo (FixedPart)', np.array(expected_pneo), pneo_engine.pneo(index, masks, decs_result, fixed))
+    print("%s: %d sub-corpora, sub-corpora and Pneo values identical" % (pattern, nr_sim))
@@ -0,0 +1,106 @@
+# On-disk store for long simulation runs
+# Every finished chunk of simulations is written to its own file in the checkpoint directory, together with a file
+# run.json that holds the parameters of the run and the seed (entropy) from which the random streams of all simulations
+# are derived - this is the complete random state of the run. When a run is started again with the same checkpoint directory,
+# the chunks that are already there are loaded and only the missing simulations are computed.
+# A checkpoint directory that was written with different parameters is not touched.
+# The scripts remove the directory (clear) when the run is complete, so a checkpoint is only ever resumed by the run that
+# was interrupted.
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+class CheckpointStore:
+    def __init__(self, path):
+        self.path = path
+        self.run_file = os.path.join(path, 'run.json')
+
+    # open the store for a run with the given parameters and return the entropy of the run.
+    # parameters are compared in their JSON form, so tuples and lists, ranges and lists etc. should be passed consistently.
+    def open(self, params, seed=None):
+        params = json.loads(json.dumps(params))
+        if os.path.exists(self.run_file):
+            with open(self.run_file, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored['params'] != params:
+                raise ValueError("checkpoint %s was written with different parameters: %s" % (self.path, stored['params']))
+            if seed is not None and np.random.SeedSequence(seed).entropy != stored['entropy']:
+                raise ValueError("checkpoint %s was written with a different seed" % self.path)
+            return stored['entropy']
+
+        os.makedirs(self.path, exist_ok=True)
+        entropy = np.random.SeedSequence(seed).entropy
+        self._write(self.run_file, lambda f: f.write(json.dumps({'params': params, 'entropy': entropy}, indent=1).encode('utf-8')))
+        return entropy
+
+    # remove the store (after the run is complete)
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # write to a temporary file first, so that a crash never leaves an incomplete file behind
+    def _write(self, path, write):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # a chunk is either an array of results (one row per simulation) or an aggregate of them (aggregate.StreamingBands)
+    def write(self, first, last, result):
+        if isinstance(result, np.ndarray):
+            self._write(os.path.join(self.path, 'chunk_%09d_%09d.npy' % (first, last)), lambda f: np.save(f, result))
+        else:
+            self._write(os.path.join(self.path, 'chunk_%09d_%09d.npz' % (first, last)), result.save)
+
+    # the complete chunks in the store: a list of (first, last, filename)
+    def completed(self):
+        found = []
+        for name in sorted(os.listdir(self.path)):
+            if name.startswith('chunk_') and name.endswith(('.npy', '.npz')):
+                first, last = name[6:-4].split('_')
+                found.append((int(first), int(last), os.path.join(self.path, name)))
+        return found
+
+    # the simulations (out of 0, ..., nr_sim-1) that are not yet in the store, as a list of chunks (first, last)
+    def missing(self, nr_sim, chunk_size):
+        done = np.zeros(nr_sim + 1, dtype=bool)
+        done[-1] = True
+        for first, last, name in self.completed():
+            done[first:min(last, nr_sim)] = True
+        parts = []
+        n = 0
+        while n < nr_sim:
+            if done[n]:
+                n += 1
+                continue
+            last = min(n + chunk_size, np.argmax(done[n:]) + n)
+            parts.append((n, last))
+            n = last
+        return parts
+
+    # load the results of the simulations 0, ..., nr_sim-1
+    def load(self, nr_sim):
+        rows = None
+        for first, last, name in self.completed():
+            if first >= nr_sim:
+                continue
+            chunk = np.load(name)
+            if rows is None:
+                rows = np.empty((nr_sim,) + chunk.shape[1:], dtype=chunk.dtype)
+            rows[first:min(last, nr_sim)] = chunk[:min(last, nr_sim) - first]
+        return rows
+
+    # merge the aggregated chunks of the simulations 0, ..., nr_sim-1 into the aggregate bands
+    def load_aggregate(self, bands, nr_sim):
+        for first, last, name in self.completed():
+            if first >= nr_sim:
+                continue
+            if last > nr_sim:
+                raise ValueError("chunk %s extends beyond %d simulations and cannot be split" % (name, nr_sim))
+            bands.merge(type(bands).load(name))
+        return bands
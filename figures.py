@@ -0,0 +1,175 @@
+# The figures of the paper (plot_1_CLLT.py ... plot_5_CLLT.py and render_CLLT.py)
+# The data of a figure are loaded and summarised once (saily_data, pneo_data), and the figures are drawn from these summaries,
+# so that one process can render all figures from the same data. The summaries are read from the summary files that the
+# simulation scripts write (see summary.py); only if there is none, they are computed from the simulations. The figures are matplotlib Figure objects that are not
+# registered with pyplot, so they can be drawn in worker processes and do not stay in memory after they have been saved.
+# The confidence bands (fill_between with many vertices) are rasterized: in vector output (pdf, svg), only the bands are
+# embedded as images at the dpi of the output, the lines, points and labels stay vectors. save writes a figure for several
+# output targets, each with its own format and resolution.
+
+import os
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+import matplotlib.patches as mpatches
+
+import bands
+import incremental
+import rarefaction
+import summary
+import text_index
+
+LEVELS = (0.98, 0.9)
+COLOURS = {0.98: 'grey', 0.9: 'dimgrey'}
+
+# the labels of the decades in figures 1 and 2: (decade, decade of the point, offset, horizontal and vertical alignment)
+SAILY_LABELS = {
+    'isch': [(0, 0, (0, -20), 'center', 'top'), (3, 3, (0, -20), 'center', 'top'), (4, 4, (0, -20), 'center', 'top'),
+             (8, 8, (0, 20), 'center', 'bottom'), (9, 9, (0, 20), 'center', 'bottom'),
+             (1, 1, (20, -20), 'left', 'top'), (2, 2, (-20, 20), 'right', 'bottom'), (5, 5, (30, -10), 'left', 'top'),
+             (6, 6, (10, -20), 'left', 'top'), (7, 6, (-20, 20), 'center', 'bottom')],
+    'nis': [(0, 0, (0, -20), 'center', 'top'), (1, 1, (0, -20), 'center', 'top'), (5, 5, (0, -20), 'center', 'top'),
+            (7, 7, (0, -20), 'center', 'top'), (3, 3, (0, 20), 'center', 'bottom'), (8, 8, (0, 20), 'center', 'bottom'),
+            (9, 9, (0, 20), 'center', 'bottom'), (2, 2, (-20, -20), 'right', 'top'), (4, 4, (-20, 20), 'right', 'bottom'),
+            (6, 6, (20, -20), 'left', 'top')],
+}
+
+
+# warn if the results have been flagged as stale, because texts or occurrences have been added to the corpus since they
+# were written (see incremental.py)
+def _check_stale(path):
+    flag = incremental.stale(path)
+    if flag is not None:
+        print("warning: %s is stale, the corpus has changed in the decades %s" % (path, ", ".join(str(dec) for dec in flag['decades'])))
+
+
+# the simulations of a Säily pattern, summarised (see summary.saily_summary): the mean curve (or the analytic expected curve),
+# the confidence bands, and the actual number of tokens and types per decade
+def saily_data(name, decs, xnew, analytic_mean=False):
+    path = summary.summary_path("data/%s_types_over_tokens_total.csv" % name)
+    data = summary.load(path) if os.path.exists(path) else None
+    _check_stale(path if data is not None else "data/%s_types_over_tokens_total.bin" % name)
+    if data is None or list(data['decs']) != list(decs):
+        # no summary (or one for other decades): compute it from the simulations and the index of the texts
+        data = summary.saily_summary(bands.load("data/%s_types_over_tokens_total.csv" % name, range(len(xnew))), xnew,
+                                     text_index.TextIndex.load('data/%s_texts_index.npz' % name), decs, LEVELS)
+    data = dict(data, name=name, decs=list(decs), mean_sims=data['mean'], conf_bands=summary.conf_bands(data),
+                running_words_dec=pd.DataFrame({'Freq': data['tokens_dec']}, index=pd.Index(list(decs), name='Dekade')))
+    # with analytic_mean, the analytic expected curve (written by the Säily script with analytic = True) replaces the mean of
+    # the simulations. It is mapped onto the token axis with the mean length of the texts, so it differs slightly from the
+    # mean of the simulations at a fixed number of tokens, which plot 3 compares with the decades
+    if analytic_mean and np.isnan(data['expected']).all() and os.path.exists("data/%s_expected_types.npz" % name):
+        data['expected'] = rarefaction.load("data/%s_expected_types.npz" % name)['mean']
+    if analytic_mean and not np.isnan(data['expected']).all():
+        data['mean'] = data['expected']
+    return data
+
+
+# the simulations of a Pneo pattern, summarised: the mean and the confidence bands per decade
+def pneo_data(path, decs):
+    file = summary.summary_path(path)
+    _check_stale(file if os.path.exists(file) else os.path.splitext(path)[0] + '.bin')
+    data = summary.load(file) if os.path.exists(file) else summary.pneo_summary(bands.load(path, decs), decs, LEVELS)
+    return dict(data, conf_bands=summary.conf_bands(data))
+
+
+# the distance between the actual number of types per decade and the mean of the simulations at the same size,
+# together with the cumulative number of running words (figure 3)
+def distance_table(data):
+    return pd.DataFrame({"types": data['types_dec'], "running_words": data['tokens_dec'], "mean_diff": data['mean_diff'],
+                         "running_words_cumulative": data['running_words_cumulative']})
+
+
+def _legend(ax, loc):
+    # proxy artists
+    p1 = mpatches.Rectangle((0, 0), 1, 1, fc="white", edgecolor = "dimgrey")
+    p5 = mpatches.Rectangle((0, 0), 1, 1, fc="lightgrey", edgecolor = "dimgrey")
+    p = mpatches.Rectangle((0, 0), 1, 1, fc=[0.6,0.6,0.6], edgecolor = "dimgrey")
+    ax.legend([p,p5,p1], ["p > 0.05", "p < 0.05", "p < 0.01"], loc = loc)
+
+
+# convert the ticks of the x axis to millions of running words
+def _millions(ax):
+    locs = ax.get_xticks()
+    ax.set_xticks(locs, ["%g" % x for x in locs / 1000000])
+
+
+# figures 1 and 2: the number of types over the number of running words, with the confidence bands and the actual decades
+def saily_figure(data, xnew, ylim):
+    fig = Figure(figsize = (6,6))
+    ax1 = fig.add_subplot(111)
+    decs, running_words_dec, types_dec = data['decs'], data['running_words_dec'], data['types_dec']
+
+    # draw a line of the mean values, and points for the actual values
+    ax1.plot(xnew, data['mean'], linewidth = 0.7, color = "black")
+    ax1.plot(running_words_dec, types_dec, '.', c = "black")
+
+    ax1.set_title('-' + data['name'], style = 'italic', family =  'serif')
+    ax1.set_ylabel("Types", fontsize=12)
+    ax1.set_xlabel("Running words (millions)", fontsize=12)
+    ax1.grid()
+    ax1.set_ylim(*ylim)
+    ax1.set_xlim(0,14000000)
+    _millions(ax1)
+
+    # add boundaries for 98% and 90% of the data
+    bands.fill_bands(ax1, xnew, data['conf_bands'], COLOURS, rasterized = True)
+    _legend(ax1, 4)
+
+    # labels for the points
+    for i, j, offset, ha, va in SAILY_LABELS.get(data['name'], []):
+        ax1.annotate(decs[i], (running_words_dec.loc[decs[i],'Freq'], types_dec[j]),
+                     xytext=offset, textcoords='offset points', ha=ha, va=va,
+                     bbox=dict(fc='white', alpha=0.5),
+                     arrowprops=dict(arrowstyle = '-', connectionstyle='arc3,rad=0'))
+
+    fig.tight_layout(pad = 2)
+    return fig
+
+
+# figure 3: the distance to the mean of the simulations over the cumulative number of running words, one panel per pattern.
+# tables: a list of (title, distance_table, ylim)
+def distance_figure(tables, decs):
+    fig = Figure(figsize = (10,5))
+    for n, (title, table, ylim) in enumerate(tables):
+        ax = fig.add_subplot(1, len(tables), n + 1)
+        ax.plot(table["running_words_cumulative"], table["mean_diff"], '.', c = "black")
+        ax.set_title(title, style = 'italic', family =  'serif')
+        ax.set_ylabel("Actual V - mean V (100,000 iterations)", fontsize=12)
+        ax.set_xlabel("Running words (millions), cumulative", fontsize=12)
+        ax.grid()
+        _millions(ax)
+        for i in range(len(decs)):
+            ax.annotate(decs[i], (table.loc[i,"running_words_cumulative"], table.loc[i,"mean_diff"]),
+                        xytext=(0, -12), textcoords='offset points', ha='center', va='top',
+                        arrowprops=dict(arrowstyle = '-', connectionstyle='arc3,rad=0'))
+        ax.set_ylim(*ylim)
+    fig.tight_layout(pad = 2)
+    return fig
+
+
+# figures 4 and 5: the Pneo values per decade with the confidence bands, one panel per pattern.
+# panels: a list of (title, pneo_data, ylim, legend location)
+def pneo_figure(panels, decs, figsize, xlim=(1800,1900)):
+    fig = Figure(figsize = figsize)
+    for n, (title, data, ylim, loc) in enumerate(panels):
+        ax = fig.add_subplot(len(panels), 1, n + 1)
+        ax.set_ylabel("$P_{neo}$", fontsize=16)
+        ax.plot(decs, data['mean'], linewidth = 0.7, color = "black")
+        ax.set_title(title, style = 'italic', family =  'serif')
+        ax.grid()
+        ax.set_ylim(*ylim)
+        ax.set_xlim(*xlim)
+        bands.fill_bands(ax, decs, data['conf_bands'], COLOURS, rasterized = True)
+        _legend(ax, loc)
+    fig.tight_layout(pad = 2)
+    return fig
+
+
+# save a figure for several output targets: a dictionary file name -> dpi. The format follows from the extension of the
+# file name (png: a raster image at dpi; pdf, svg: vector output, with the rasterized bands at dpi)
+def save(fig, targets):
+    for path, dpi in targets.items():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fig.savefig(path, dpi=dpi)
@@ -0,0 +1,346 @@
+# Incremental (append-only) ingestion of a growing corpus
+# The DTA keeps growing: texts are appended to the list of texts (texts_dta.csv) and new hits to the lists of occurrences.
+# Instead of reading and counting both lists from scratch, an IngestState keeps the counted occurrences
+# (text_index.OccurrenceCounts), the list of texts and the statistics per decade in a state directory
+# (e.g. data/incremental/isch_pneo), together with the number of bytes of each list that have been read and a hash of them.
+# update() reads only the rows that have been appended since, counts them against the whole list of texts and merges them
+# into the counts: new texts get the next file codes, new lemmas are added to the vocabulary, and the result is the same as
+# counting the whole lists again. A list that has been changed in any other way (its first part no longer has the remembered
+# hash) is read again from the start, and so are the occurrences if new texts have occurrences that were read (and left out,
+# see OccurrenceCounts.from_chunks) before the text itself was listed.
+# Each update determines the decades that have changed (those of the new texts and occurrences; after reading everything
+# again, those in which any text or count differs from before), and flags the simulation results that depend on them as stale (stale.json in the state directory): result files of the
+# scripts with their csv, bands and summary files, and the pipeline cache entries built from the same lists. A flag lapses
+# as soon as the flagged file has been written again.
+
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import results_io
+import summary
+import text_index
+
+STATE_DIR = 'data/incremental'
+BLOCK = 1 << 20
+
+
+# the list has been changed other than by appending rows (or new texts need occurrences that were left out): read it again
+class Rebuild(Exception):
+    pass
+
+
+# a binary stream that hashes and counts everything read from it
+class _HashingReader(io.RawIOBase):
+    def __init__(self, f, digest):
+        self.f = f
+        self.digest = digest
+        self.size = 0
+        self.last = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(len(buffer))
+        buffer[:len(data)] = data
+        self.digest.update(data)
+        self.size += len(data)
+        self.last = data[-1:] or self.last
+        return len(data)
+
+
+# a list of texts or occurrences (csv file or zip archive, see ingest.source) of which the first size bytes (with the hash
+# digest and the columns columns) have been read before; read = None: nothing has been read
+class Source:
+    def __init__(self, path, sep=None, read=None):
+        self.path = ingest.source(path)
+        self.sep = ingest.sniff_separator(self.path) if sep is None else sep
+        self.read = read
+        self.size = None
+        self.digest = None
+        self.newline = None
+        self.columns = None if read is None else read['columns']
+
+    # the rows appended since the last read, in chunks of chunk_size rows. Raises Rebuild (before the first chunk) if the
+    # part read before has changed, or if the appended text continues its last row (the shipped lists do not end with
+    # a line break). Afterwards, size and digest describe the whole list.
+    def rows(self, chunk_size=1000000):
+        digest = hashlib.sha256()
+        with ingest.open_csv(self.path) as f:
+            reader = _HashingReader(f, digest)
+            if self.read is not None:
+                while reader.size < self.read['size'] and reader.read(min(BLOCK, self.read['size'] - reader.size)):
+                    pass
+                if reader.size < self.read['size'] or digest.hexdigest() != self.read['digest']:
+                    raise Rebuild("%s has changed (not only appended rows)" % self.path)
+            header = {} if self.columns is None else {'header': None, 'names': self.columns}
+            stream = io.BufferedReader(reader, BLOCK)
+            if self.read is not None and not self.read['newline'] and stream.peek(1)[:1] not in (b'', b'\n', b'\r'):
+                raise Rebuild("the rows appended to %s continue its last row" % self.path)
+            try:
+                for chunk in pd.read_csv(stream, sep = self.sep, encoding = 'utf-8', chunksize = chunk_size, **header):
+                    self.columns = [str(column) for column in chunk.columns]
+                    yield chunk.drop(columns=[column for column in chunk.columns if str(column).startswith('Unnamed: ')])
+            except pd.errors.EmptyDataError:
+                pass
+            while reader.read(BLOCK):
+                pass
+        self.size, self.digest, self.newline = reader.size, digest.hexdigest(), reader.last in (b'\n', b'\r')
+
+    def state(self):
+        return {'path': self.path, 'sep': self.sep, 'size': self.size, 'digest': self.digest, 'newline': self.newline,
+                'columns': self.columns}
+
+
+# the number of running words, of occurrences and of types (distinct lemmas) in each decade. The types are kept as the
+# list of distinct (decade, lemma) pairs, so that the types of new occurrences can be added without counting again.
+class DecadeStats:
+    def __init__(self, tokens, occurrences, pair_dec, pair_lemma):
+        self.tokens = tokens
+        self.occurrences = occurrences
+        self.pair_dec = np.asarray(pair_dec, dtype=np.int64)
+        self.pair_lemma = np.asarray(pair_lemma, dtype=object)
+
+    # the statistics of the list of texts (Datei, Dekade, Freq) and of its counted occurrences
+    @classmethod
+    def from_counts(cls, texts, counts):
+        occurrences = pd.Series(np.bincount(counts.occ_dec, weights=counts.occ_count, minlength=len(counts.decades)),
+                                index=counts.decades).astype(np.int64)
+        pairs = np.unique(counts.occ_dec * len(counts.lemmas) + counts.occ_lemma)
+        return cls(texts.groupby('Dekade')['Freq'].sum(), occurrences[occurrences > 0],
+                   counts.decades[pairs // len(counts.lemmas)], counts.lemmas[pairs % len(counts.lemmas)])
+
+    # add the statistics of further texts and occurrences (e.g. DecadeStats.from_counts of the appended rows)
+    def merge(self, other):
+        pairs = pd.DataFrame({'dec': np.concatenate((self.pair_dec, other.pair_dec)),
+                              'lemma': np.concatenate((self.pair_lemma, other.pair_lemma))}).drop_duplicates()
+        pairs = pairs.sort_values(['dec', 'lemma'])
+        return DecadeStats(self.tokens.add(other.tokens, fill_value=0).astype(np.int64),
+                           self.occurrences.add(other.occurrences, fill_value=0).astype(np.int64),
+                           pairs['dec'].values, pairs['lemma'].values)
+
+    # a table with one row per decade: running words (Freq), occurrences and types
+    def table(self):
+        types = pd.Series(self.pair_dec).value_counts()
+        table = pd.DataFrame({'Freq': self.tokens, 'occurrences': self.occurrences, 'types': types})
+        table.index.name = 'Dekade'
+        return table.fillna(0).astype(np.int64).sort_index()
+
+    def save(self, path):
+        np.savez(path, token_dec=self.tokens.index.values, tokens=self.tokens.values,
+                 occurrence_dec=self.occurrences.index.values, occurrences=self.occurrences.values,
+                 pair_dec=self.pair_dec, pair_lemma=np.asarray(self.pair_lemma, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(pd.Series(data['tokens'], index=data['token_dec']),
+                       pd.Series(data['occurrences'], index=data['occurrence_dec']),
+                       data['pair_dec'], data['pair_lemma'].astype(object))
+
+
+# the counts as a table: one row per file, decade and lemma
+def _entries(counts):
+    return pd.DataFrame({'Datei': counts.files[counts.occ_file].astype(str), 'Dekade': counts.decades[counts.occ_dec],
+                         'Lemma': counts.lemmas[counts.occ_lemma].astype(str), 'count': counts.occ_count})
+
+
+# the decades in which the texts (Datei, Dekade, Freq) or the counted occurrences of two versions of the lists differ
+def changed_decades(texts_before, counts_before, texts_after, counts_after):
+    decades = set()
+    for before, after in ((texts_before[['Datei', 'Dekade', 'Freq']], texts_after[['Datei', 'Dekade', 'Freq']]),
+                          (_entries(counts_before), _entries(counts_after))):
+        differences = pd.concat([before.drop_duplicates(), after.drop_duplicates()]).drop_duplicates(keep=False)
+        decades.update(differences['Dekade'])
+    return sorted(int(dec) for dec in decades)
+
+
+# the files that belong to a result file: its csv export, its bands (aggregate mode) and its plot summary
+def result_files(path):
+    stem = os.path.splitext(path)[0]
+    return [path] + [file for file in (stem + '.csv', stem + '_bands.npz', summary.summary_path(path)) if file != path]
+
+
+# the decades of the corpus that a result depends on: the decades in its metadata (the Pneo results: decs), or None if
+# it depends on all of them (the Säily results: every text of the list is shuffled into the corpus)
+def result_decades(path):
+    if not path.endswith('.bin') or not os.path.exists(path):
+        return None
+    decs = results_io.read_results(path).meta.get('decs')
+    return None if decs is None else [int(dec) for dec in decs]
+
+
+def _file_stamp(path):
+    status = os.stat(path)
+    return {'size': status.st_size, 'mtime': status.st_mtime_ns}
+
+
+# flags for the result files (and the files that belong to them) that depend on one of the changed decades
+def flag_results(results, decades):
+    flags = {}
+    for result in results:
+        used = result_decades(result)
+        affected = sorted(decades if used is None else set(decades) & set(used))
+        if not affected:
+            continue
+        for path in result_files(result):
+            if os.path.exists(path):
+                flags[path] = dict(_file_stamp(path), decades=affected)
+    return flags
+
+
+# flags for the pipeline cache entries (see pipeline.py) that were built from one of the lists: the ingest entries that
+# read them, and every entry that depends on a flagged entry
+def flag_cache(cache_dir, sources, decades):
+    entries = {}
+    if cache_dir is not None and os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if os.path.exists(os.path.join(cache_dir, name, 'stage.json')):
+                with open(os.path.join(cache_dir, name, 'stage.json'), encoding='utf-8') as f:
+                    entries[name] = json.load(f)
+    sources = {os.path.normpath(ingest.source(path)) for path in sources}
+    stale = {name for name, entry in entries.items() if entry['stage'] == 'ingest' and
+             {os.path.normpath(ingest.source(entry['params'][key])) for key in ('texts', 'occurrences')} & sources}
+    keys = {name.split('_', 1)[1] for name in stale}
+    while True:
+        found = {name for name, entry in entries.items() if name not in stale and set(entry['depends'].values()) & keys}
+        if not found:
+            break
+        stale |= found
+        keys |= {name.split('_', 1)[1] for name in found}
+    return {os.path.join(cache_dir, name): dict(_file_stamp(os.path.join(cache_dir, name, 'stage.json')), decades=decades)
+            for name in sorted(stale)}
+
+
+# a flag lapses when its file has been written again (or removed)
+def _active(path, flag):
+    stamp = os.path.join(path, 'stage.json') if os.path.isdir(path) else path
+    return os.path.exists(stamp) and _file_stamp(stamp) == {'size': flag['size'], 'mtime': flag['mtime']}
+
+
+# the active stale flag of a result file or cache entry (from all state directories), or None
+def stale(path, state_dir=STATE_DIR):
+    if not os.path.isdir(state_dir):
+        return None
+    for name in os.listdir(state_dir):
+        flags = IngestState(os.path.join(state_dir, name)).stale()
+        for flagged, flag in flags.items():
+            if os.path.normpath(flagged) == os.path.normpath(path):
+                return flag
+    return None
+
+
+class IngestState:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def state(self):
+        if not os.path.exists(self._path('state.json')):
+            return None
+        with open(self._path('state.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def counts(self):
+        return text_index.OccurrenceCounts.load(self._path('counts.npz'))
+
+    def texts(self):
+        return pd.read_csv(self._path('texts.csv'))
+
+    def stats(self):
+        return DecadeStats.load(self._path('stats.npz'))
+
+    # the text index of the current lists (for the Säily simulations)
+    def text_index(self):
+        return text_index.TextIndex.from_counts(self.texts(), self.counts())
+
+    # the active stale flags: path -> {size, mtime, decades}
+    def stale(self):
+        if not os.path.exists(self._path('stale.json')):
+            return {}
+        with open(self._path('stale.json'), encoding='utf-8') as f:
+            flags = json.load(f)
+        return {path: flag for path, flag in flags.items() if _active(path, flag)}
+
+    # read the rows appended to the list of texts and the list of occurrences since the last update (everything at the
+    # first update) and merge them into the state. results: the result files that are built from these lists (their
+    # flags depend on the decades in their metadata); cache_dir: the pipeline cache whose entries are flagged.
+    # Returns a dict with the decade table, the changed decades and the new flags.
+    def update(self, texts, occurrences, sep=None, results=(), cache_dir=None, chunk_size=1000000):
+        state = self.state()
+        try:
+            return self._update(state, texts, occurrences, sep, results, cache_dir, chunk_size)
+        except Rebuild as reason:
+            print("%s: %s, reading everything again" % (self.directory, reason))
+            return self._update(state, texts, occurrences, sep, results, cache_dir, chunk_size, rebuild=True)
+
+    def _update(self, state, texts, occurrences, sep, results, cache_dir, chunk_size, rebuild=False):
+        incremental = state is not None and not rebuild
+        text_source = Source(texts, ',', state['texts'] if incremental else None)
+        occurrence_source = Source(occurrences, sep, state['occurrences'] if incremental else None)
+        new_texts = list(text_source.rows())
+        new_texts = pd.concat(new_texts, ignore_index=True) if new_texts else None
+        all_texts = self.texts() if incremental else pd.DataFrame()
+        if new_texts is not None:
+            all_texts = pd.concat([all_texts, new_texts], ignore_index=True)
+        if incremental and new_texts is not None and set(new_texts['Datei']) & set(state['unmatched']):
+            raise Rebuild("new texts have occurrences that were left out before")
+
+        # count the new occurrences against the whole list of texts; occurrences in files that are not listed are left
+        # out, and their files are remembered
+        unmatched = set(state['unmatched']) if incremental else set()
+
+        def chunks():
+            for chunk in occurrence_source.rows(chunk_size):
+                unmatched.update(pd.unique(chunk['Datei'][~chunk['Datei'].isin(all_texts['Datei'])].dropna()))
+                yield chunk
+        delta = text_index.OccurrenceCounts.from_chunks(all_texts, chunks())
+        unmatched.difference_update(all_texts['Datei'])
+        if incremental:
+            counts = self.counts().merge(delta)
+            delta_stats = DecadeStats.from_counts(new_texts if new_texts is not None else all_texts.iloc[:0], delta)
+            stats = self.stats().merge(delta_stats)
+        else:
+            counts = delta
+            stats = DecadeStats.from_counts(all_texts, counts)
+
+        # the decades that changed: those of the new rows, or (after reading everything again, since the old rows may have
+        # been edited in any way) those in which the texts or the counts differ from before
+        if state is None:
+            decades = []
+        elif rebuild:
+            decades = changed_decades(self.texts(), self.counts(), all_texts, counts)
+        else:
+            decades = set(delta.decades[np.unique(delta.occ_dec)])
+            decades = sorted(int(dec) for dec in decades.union([] if new_texts is None else new_texts['Dekade'].dropna()))
+
+        os.makedirs(self.directory, exist_ok=True)
+        counts.save(self._path('counts.npz'))
+        all_texts.to_csv(self._path('texts.csv'), index=False)
+        stats.save(self._path('stats.npz'))
+        flags = {}
+        if decades:
+            flags = dict(flag_results(results, decades), **flag_cache(cache_dir, (texts, occurrences), decades))
+        all_flags = self.stale()
+        for path, flag in flags.items():
+            if path in all_flags:
+                flag['decades'] = sorted(set(flag['decades']) | set(all_flags[path]['decades']))
+            all_flags[path] = flag
+        with open(self._path('stale.json'), 'w', encoding='utf-8') as f:
+            json.dump(all_flags, f, indent=1)
+        history = (state or {}).get('history', []) + [{
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'mode': 'incremental' if incremental else 'rebuild' if state else 'initial',
+            'new_texts': 0 if new_texts is None else len(new_texts), 'changed_decades': decades}]
+        with open(self._path('state.json'), 'w', encoding='utf-8') as f:
+            json.dump({'texts': text_source.state(), 'occurrences': occurrence_source.state(),
+                       'unmatched': sorted(str(name) for name in unmatched), 'history': history}, f, indent=1)
+        return {'table': stats.table(), 'changed_decades': decades, 'stale': flags, 'mode': history[-1]['mode']}
@@ -0,0 +1,70 @@
+# Incremental ingestion of texts and occurrences that have been added to the corpus
+# When texts are appended to the list of texts or new hits to a list of occurrences, this script reads only the new rows
+# and merges them into the counted occurrences and the text index of each pattern (see incremental.py), instead of
+# preprocessing everything again. The first run reads the lists completely. For each pattern, it prints the running words,
+# occurrences and types per decade, the decades that have changed, and the simulation results and pipeline cache entries
+# that are stale because of the change (they are listed in data/incremental/<pattern>/stale.json until they are written again).
+# Patterns whose list of occurrences (or of texts) is not in data/ are skipped.
+
+import os
+import pandas as pd
+from timeit import default_timer as timer
+
+import incremental
+import ingest
+import metrics
+
+# Timer
+start =  timer()
+
+# set parameters
+state_dir = incremental.STATE_DIR # the counts and the statistics of each pattern are kept here
+cache_dir = 'data/cache'   # the pipeline cache whose entries are flagged (None: none)
+chunk_size = 1000000       # nr of rows of the lists of occurrences that are read at a time
+# the patterns: name -> the list of texts, the list of occurrences and its separator, the text index that is written
+# (None: none) and the result files that are built from these lists
+patterns = {
+    'isch_saily': {'texts': 'data/dta_texts_18c.csv', 'occurrences': 'data/isch_18c.csv', 'sep': ';',
+                   'index': 'data/isch_texts_index.npz',
+                   'results': ['data/isch_types_over_tokens_total.bin', 'data/isch_expected_types.npz']},
+    'nis_saily': {'texts': 'data/dta_texts_18c.csv', 'occurrences': 'data/nis_18c.csv', 'sep': ';',
+                  'index': 'data/nis_texts_index.npz',
+                  'results': ['data/nis_types_over_tokens_total.bin', 'data/nis_expected_types.npz']},
+    'isch_pneo': {'texts': 'data/texts_dta.csv', 'occurrences': 'data/isch.csv', 'sep': ';', 'index': None,
+                  'results': ['data/ISCH_pneo_global_100.bin']},
+    'nis_pneo': {'texts': 'data/texts_dta.csv', 'occurrences': 'data/nis.csv', 'sep': ';', 'index': None,
+                 'results': ['data/NIS_pneo_global_100.bin']},
+    'tum_pneo': {'texts': 'data/texts_dta.csv', 'occurrences': 'data/tum.csv', 'sep': ',', 'index': None,
+                 'results': ['data/TUM_pneo_global_100.bin']},
+}
+run_patterns = list(patterns) # the patterns that are updated
+
+# check the inputs of all patterns first, so that no state is updated if a list is missing
+available = []
+for name in run_patterns:
+    missing = [path for path in (patterns[name]['occurrences'], patterns[name]['texts']) if not os.path.exists(ingest.source(path))]
+    if missing:
+        print("skipping %s: %s not found" % (name, ", ".join(missing)))
+    else:
+        available.append(name)
+
+run_metrics = metrics.RunMetrics('incremental', params = {'patterns': available})
+for name in available:
+    config = patterns[name]
+    run_metrics.stage(name)
+    state = incremental.IngestState(os.path.join(state_dir, name))
+    update = state.update(config['texts'], config['occurrences'], sep = config['sep'], results = config['results'],
+                          cache_dir = cache_dir, chunk_size = chunk_size)
+    if config['index'] is not None:
+        state.text_index().save(config['index'])
+
+    print("%s (%s):" % (name, update['mode']))
+    with pd.option_context('display.max_rows', None):
+        print(update['table'])
+    print("changed decades:", update['changed_decades'] or "none")
+    for path, flag in update['stale'].items():
+        print("stale:", path, "(decades %s)" % ", ".join(str(dec) for dec in flag['decades']))
+run_metrics.finish()
+
+end = timer()
+print("time elapsed: ", end - start)
@@ -0,0 +1,87 @@
+# Resampling inference for Spearman's rho (plot 3)
+# With only ten decades, the p-value of scipy.stats.spearmanr rests on a t approximation, and it treats the mean of the
+# simulations as exact. spearman_inference instead evaluates many resamples at once as arrays (one row per resample):
+#   permutation test   the ranks are computed once; each permutation only reorders the ranks of y, so the rho of all
+#                      permutations is one matrix-vector product
+#   bootstrap          the decades are resampled with replacement and re-ranked row by row (ties get average ranks)
+#   Monte Carlo draws  the mean of nr_sim simulations has the covariance cov / nr_sim at the sizes of the decades
+#                      (summary.decade_cov); y is evaluated against draws of the mean from this distribution, alone
+#                      (the uncertainty that the simulations add) and together with the bootstrap of the decades
+# Tens of thousands of resamples of ten decades take a few hundredths of a second.
+
+import numpy as np
+from scipy.stats import rankdata
+
+BLOCK = 100000
+
+
+# Spearman's rho of each row of x and y (arrays with the observations in the last axis; the Pearson correlation of the ranks).
+# rho is NaN for resamples in which x or y is constant
+def spearman(x, y):
+    return pearson(rankdata(x, axis=-1), rankdata(y, axis=-1))
+
+
+def pearson(x, y):
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x * y).sum(axis=-1) / np.sqrt((x * x).sum(axis=-1) * (y * y).sum(axis=-1))
+
+
+# the two-sided p-value of rho under random permutations of y, and the rho of each permutation.
+# (1 + the number of permutations with |rho| at least as large) / (1 + nr_resamples), so the p-value is never 0
+def permutation_test(x, y, nr_resamples, rng):
+    rx = rankdata(x) - (len(x) + 1) / 2
+    ry = rankdata(y) - (len(y) + 1) / 2
+    norm = np.sqrt((rx * rx).sum() * (ry * ry).sum())
+    rho = (rx * ry).sum() / norm
+    rhos = np.empty(nr_resamples)
+    for start in range(0, nr_resamples, BLOCK):
+        size = min(BLOCK, nr_resamples - start)
+        rhos[start:start + size] = rng.permuted(np.tile(ry, (size, 1)), axis=1) @ rx / norm
+    p = (1 + np.count_nonzero(np.abs(rhos) >= np.abs(rho) - 1e-12)) / (1 + nr_resamples)
+    return p, rhos
+
+
+# rho of bootstrap resamples of the pairs (x, y); y can have one row per resample (e.g. Monte Carlo draws)
+def bootstrap(x, y, nr_resamples, rng):
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    rows = np.arange(nr_resamples)[:, None]
+    choice = rng.integers(0, len(x), (nr_resamples, len(x)))
+    return spearman(x[choice], y[rows, choice] if y.ndim == 2 else y[choice])
+
+
+# draws of y = actual - mean when the mean (of nr_sim simulations with the covariance cov) is itself uncertain
+def monte_carlo_draws(y, cov, nr_sim, nr_resamples, rng):
+    return np.asarray(y, dtype=float) - rng.multivariate_normal(np.zeros(len(y)), np.asarray(cov) / nr_sim, nr_resamples)
+
+
+# the interval that holds level of the resampled values (NaN values are left out)
+def interval(values, level):
+    return tuple(np.nanquantile(values, [(1 - level) / 2, (1 + level) / 2]))
+
+
+# Spearman's rho between x and y with a permutation p-value and bootstrap confidence intervals. cov, nr_sim: the covariance
+# of the simulations at the points of y and their number (y = actual - mean of the simulations); None: the mean is taken as exact.
+# Returns a dict: rho, p (permutation), ci (bootstrap), ci_mc (Monte Carlo draws only), ci_total (both), and the seed.
+def spearman_inference(x, y, cov=None, nr_sim=None, nr_resamples=20000, level=0.95, seed=None):
+    entropy = np.random.SeedSequence(seed).entropy
+    rng = np.random.default_rng(entropy)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    p, _ = permutation_test(x, y, nr_resamples, rng)
+    result = {'rho': float(spearman(x, y)), 'p': p, 'ci': interval(bootstrap(x, y, nr_resamples, rng), level),
+              'level': level, 'nr_resamples': nr_resamples, 'seed': entropy}
+    if cov is not None and nr_sim is not None and nr_sim > 1 and np.isfinite(cov).all():
+        draws = monte_carlo_draws(y, cov, nr_sim, nr_resamples, rng)
+        result['ci_mc'] = interval(spearman(x, draws), level)
+        result['ci_total'] = interval(bootstrap(x, draws, nr_resamples, rng), level)
+    return result
+
+
+def format_result(result):
+    text = "rho = %.3f, permutation p = %.4f (%d permutations), %g%% bootstrap CI [%.3f, %.3f]" % (
+        result['rho'], result['p'], result['nr_resamples'], 100 * result['level'], *result['ci'])
+    if 'ci_mc' in result:
+        text += ", with the Monte Carlo error of the mean: [%.3f, %.3f] (mean only), [%.3f, %.3f] (bootstrap and mean)" % (
+            *result['ci_mc'], *result['ci_total'])
+    return text
@@ -0,0 +1,153 @@
+# Ingestion of the lists of occurrences (and texts) with a parsed binary cache
+# The lists of occurrences are shipped as zip archives (e.g. data/isch.csv.zip) or as csv files with different separators
+# (';' in isch.csv, ',' in tum.csv, which also has a leading index column). read_table reads a list from the csv file or,
+# if there is none, directly from the zip archive, detects the separator, drops the index column, and stores the text
+# columns (Datei, Lemma) as categorical columns (integer codes plus the list of distinct values).
+# The parsed table is written to a binary cache (data/cache/ingest/<name>_<key>.npz, where the key is a hash of the
+# absolute path of the source file and the separator) that later runs load in a fraction of the time; the cache is
+# rebuilt when the size or the modification time of the source file changes.
+# read_counts reads a list in chunks and counts it (text_index.OccurrenceCounts); the counts are cached in the same way,
+# so the simulation scripts only parse a list again when it (or the list of texts) has changed.
+
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import text_index
+
+CACHE_DIR = 'data/cache/ingest'
+
+
+# the file a list is read from: the csv file itself or, if it does not exist, the zip archive next to it (path + '.zip')
+def source(path):
+    if os.path.exists(path) or not os.path.exists(path + '.zip'):
+        return path
+    return path + '.zip'
+
+
+# open the csv file, or the csv file in the zip archive (archives made on a Mac also contain a __MACOSX folder)
+def open_csv(path):
+    if not path.endswith('.zip'):
+        return open(path, 'rb')
+    archive = zipfile.ZipFile(path)
+    names = [name for name in archive.namelist() if name.endswith('.csv') and not name.startswith('__MACOSX')]
+    if len(names) != 1:
+        raise ValueError("%s should contain exactly one csv file, found %s" % (path, names))
+    return archive.open(names[0])
+
+
+# the separator of a csv file, determined from its first line
+def sniff_separator(path):
+    with open_csv(path) as f:
+        header = io.TextIOWrapper(f, encoding='utf-8').readline()
+    return csv.Sniffer().sniff(header, delimiters=';,\t').delimiter
+
+
+# the size and modification time of the source file; the cache is valid as long as they do not change
+def _stamp(path):
+    status = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': status.st_size, 'mtime': status.st_mtime_ns}
+
+
+# parse a csv file (or zip archive): text columns become categorical, a leading index column is dropped
+def parse(path, sep=None):
+    sep = sniff_separator(path) if sep is None else sep
+    with open_csv(path) as f:
+        table = pd.read_csv(f, sep = sep, encoding = 'utf-8')
+    unnamed = [column for column in table.columns if str(column).startswith('Unnamed: ')]
+    table = table.drop(columns=unnamed)
+    for column in table.columns:
+        if not pd.api.types.is_numeric_dtype(table[column]):
+            table[column] = table[column].astype('category')
+    return table
+
+
+# the cache file of a source file: lists of the same name in different directories (e.g. data/isch.csv and
+# data/synthetic_x10/isch.csv) or read with different separators get different cache files
+def _cache_file(path, cache_dir, sep=None):
+    key = hashlib.sha256(json.dumps([os.path.abspath(path), sep]).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, '%s_%s.npz' % (os.path.basename(path).split('.')[0], key))
+
+
+def write_cache(table, stamp, file):
+    arrays = {}
+    for column in table.columns:
+        if isinstance(table[column].dtype, pd.CategoricalDtype):
+            arrays['codes_' + column] = table[column].cat.codes.values
+            arrays['categories_' + column] = np.asarray(table[column].cat.categories, dtype=str)
+        else:
+            arrays['values_' + column] = table[column].values
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmp = file + '.tmp.npz'
+    np.savez(tmp, stamp=json.dumps(stamp), columns=np.asarray(table.columns, dtype=str), **arrays)
+    os.replace(tmp, file)
+
+
+# load a cached table; None if there is no cache or if it was written from a different version of the source file
+def read_cache(file, stamp):
+    if not os.path.exists(file):
+        return None
+    with np.load(file) as data:
+        if json.loads(str(data['stamp'])) != stamp:
+            return None
+        table = {}
+        for column in data['columns']:
+            if 'codes_' + column in data.files:
+                table[column] = pd.Categorical.from_codes(data['codes_' + column], data['categories_' + column].astype(object))
+            else:
+                table[column] = data['values_' + column]
+        return pd.DataFrame(table, columns=list(data['columns']))
+
+
+# read a list of occurrences or texts (path: the name of the csv file, e.g. 'data/isch.csv'), from the cache if possible.
+# sep: the separator (None: detect it from the first line); cache_dir=None: no cache
+def read_table(path, sep=None, cache_dir=CACHE_DIR):
+    path = source(path)
+    if cache_dir is None:
+        return parse(path, sep)
+    stamp = dict(_stamp(path), sep=sep)
+    file = _cache_file(path, cache_dir, sep)
+    table = read_cache(file, stamp)
+    if table is None:
+        table = parse(path, sep)
+        write_cache(table, stamp, file)
+    return table
+
+
+# read a list in chunks of chunk_size rows (for lists that do not fit in memory), e.g. for text_index.OccurrenceCounts.from_chunks
+def read_chunks(path, sep=None, chunk_size=1000000):
+    path = source(path)
+    sep = sniff_separator(path) if sep is None else sep
+    with open_csv(path) as f:
+        for chunk in pd.read_csv(f, sep = sep, encoding = 'utf-8', chunksize = chunk_size):
+            yield chunk.drop(columns=[column for column in chunk.columns if str(column).startswith('Unnamed: ')])
+
+
+# the counted occurrences of a list (text_index.OccurrenceCounts.from_chunks against the list of texts texts), read in
+# chunks of chunk_size rows, from the cache if possible. The cache is valid as long as the source file, the separator and
+# the files of the list of texts do not change; cache_dir=None: no cache
+def read_counts(path, texts, sep=None, chunk_size=1000000, cache_dir=CACHE_DIR):
+    if cache_dir is None:
+        return text_index.OccurrenceCounts.from_chunks(texts, read_chunks(path, sep, chunk_size))
+    path = source(path)
+    files = hashlib.sha256('\n'.join(str(file) for file in texts['Datei']).encode('utf-8')).hexdigest()
+    stamp = dict(_stamp(path), sep=sep, texts=files)
+    file = _cache_file(path, cache_dir, sep)[:-len('.npz')] + '_counts.npz'
+    if os.path.exists(file) and os.path.exists(file + '.json'):
+        with open(file + '.json', encoding='utf-8') as f:
+            if json.load(f) == stamp:
+                return text_index.OccurrenceCounts.load(file)
+    counts = text_index.OccurrenceCounts.from_chunks(texts, read_chunks(path, sep, chunk_size))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = file + '.tmp.npz'
+    counts.save(tmp)
+    os.replace(tmp, file)
+    with open(file + '.json', 'w', encoding='utf-8') as f:
+        json.dump(stamp, f)
+    return counts
@@ -0,0 +1,126 @@
+# Instrumentation of the simulation and plot scripts
+# RunMetrics times the named stages of a script (load, index, simulate, write, ...; starting a stage ends the one before),
+# records the peak memory (RSS) of the process at the end of each stage, prints progress reports with the number of
+# simulations per second and the expected time of completion (at most one every interval seconds), and writes all of it
+# to a JSON file per run (data/metrics/<name>_<time>.json), which monitoring tools can read.
+# The steps inside the simulations (e.g. resample and pivot in the Pneo simulations) run in the worker processes. They are
+# timed with timed(), summed per process, and sent back to the main process with the result of each chunk (see runner.py),
+# so their times are the sums over all workers.
+
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = 'data/metrics'
+
+# the summed times of the steps timed in this process since the last call of collect()
+_step_times = {}
+
+
+@contextmanager
+def timed(step):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _step_times[step] = _step_times.get(step, 0.0) + time.perf_counter() - start
+
+
+# the summed times of the steps since the last call, and reset them
+def collect():
+    times = dict(_step_times)
+    _step_times.clear()
+    return times
+
+
+# add the times of the steps of another process (a worker)
+def add(times):
+    for step, seconds in times.items():
+        _step_times[step] = _step_times.get(step, 0.0) + seconds
+
+
+# the peak memory of this process and of its finished child processes (the largest of them), in MB.
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+def peak_rss_mb():
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    return {'process': own, 'children': children}
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class RunMetrics:
+    # name: the name of the run (e.g. 'isch_pneo'); params: the parameters of the run, stored with the metrics;
+    # interval: the minimum number of seconds between two progress reports
+    def __init__(self, name, params=None, output_dir=METRICS_DIR, interval=10):
+        self.name = name
+        self.params = params or {}
+        self.output_dir = output_dir
+        self.interval = interval
+        self.started = time.time()
+        self.stages = []
+        self.current = None
+        self.simulations = 0
+        self.simulation_seconds = 0.0
+        self._progress_start = None
+        self._progress_done = 0
+        self._last_report = None
+        collect()
+
+    # start a new stage (and end the current one)
+    def stage(self, name):
+        self.end_stage()
+        self.current = (name, time.perf_counter())
+
+    def end_stage(self):
+        if self.current is None:
+            return
+        name, start = self.current
+        self.stages.append({'stage': name, 'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()})
+        self.current = None
+
+    # progress of the simulations: done of total simulations are finished (used as the progress callback of runner.run).
+    # A new series of simulations starts with done = 0 (the runner reports it before the first chunk).
+    def progress(self, done, total):
+        now = time.perf_counter()
+        if self._progress_start is None or done == 0 or done < self._progress_done:
+            self._progress_start, self._progress_done, self._last_report = now, 0, now
+        self.simulations += int(done - self._progress_done)
+        self._progress_done = done
+        elapsed = now - self._progress_start
+        if done >= total:
+            self.simulation_seconds += elapsed
+            self._progress_start = None
+        if done < total and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        rate = done / elapsed if elapsed > 0 else float('nan')
+        eta = (total - done) / rate if rate > 0 else float('nan')
+        print("%s: %d/%d simulations (%.0f%%), %.1f sims/s, elapsed %s, ETA %s"
+              % (self.name, done, total, 100 * done / total, rate, format_seconds(elapsed),
+                 format_seconds(eta) if eta == eta else '?'))
+
+    # end the current stage and write the metrics file; returns its path
+    def finish(self):
+        self.end_stage()
+        total = time.time() - self.started
+        report = {'name': self.name, 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                  'seconds': total, 'host': platform.node(), 'pid': os.getpid(), 'cpus': os.cpu_count(),
+                  'python': platform.python_version(), 'params': self.params, 'stages': self.stages,
+                  'simulation_steps': collect(), 'simulations': self.simulations,
+                  'sims_per_second': self.simulations / self.simulation_seconds if self.simulation_seconds else None,
+                  'peak_rss_mb': peak_rss_mb()}
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, '%s_%s.json' % (self.name, time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started))))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, default=str)
+        print("metrics saved to", path)
+        return path
@@ -7,99 +7,105 @@
 # import necessary libraries
 import pandas as pd
 import numpy as np
-from itertools import compress
 from timeit import default_timer as timer
+import pneo_engine
+import ingest
+import runner
+import checkpoint
+import aggregate
+import results_io
+import metrics
+import summary
 
 # start the timer
 start =  timer()
 
+# the stages of the run are timed, and the metrics are written to data/metrics (see metrics.py)
+run_metrics = metrics.RunMetrics('nis_pneo')
+run_metrics.stage('load')
+
 # read the necessary files:
+# the lists of occurrences are read in chunks with ingest.py (from the zip archive if there is no csv file) and counted chunk by chunk
+# (text_index.OccurrenceCounts), so that only the counts of the distinct combinations of text, decade and lemma are kept;
+# the counts are cached, and later runs load them until the list changes
 texts_dta  = pd.read_csv('data/texts_dta.csv', sep= ',') # this file contains a line for each text in the corpus, together with the respective decade and the token count
-suffix_raw  = pd.read_csv('data/nis.csv', sep = ";")       # this file contains a line for each -nis attestation in the corpus, together with the respective decade and filename
+counts  = ingest.read_counts('data/nis.csv', texts_dta, sep = ";") # this file contains a line for each -nis attestation in the corpus, together with the respective decade and filename
 
 ### set parameters
 nr_sim = 100             # nr of simulations
 decs = range(1490,1910,10) # decades in the corpus
 decs_result = range(1800,1910,10) # decades of interest
 target_size = 4000000      # maximum corpus size per decade
-
-# from the metadata (texts_dta): extract a table with the total amount of tokens per decade
-tokens_tot = pd.pivot_table(texts_dta, index = "Dekade", values = "Freq", aggfunc=np.sum)
-
-# initialize list
-pneo_global = pd.DataFrame(columns = decs_result)
-
-# the following function takes a decade (int) as input and returns a list of files similar to texts_dta...
-# ...if the real size in tokens exceeds the target size.
-# if not, it returns the actual corpus
-def shuffle_dec(decade, n):
-    real_size = int(tokens_tot.loc[tokens_tot.index == decade]["Freq"])
-    if real_size <= target_size:
-        return texts_dta.loc[texts_dta.Dekade == decade]
-    else:
-        counter = 0
-        nr_texts = len(texts_dta.loc[texts_dta.Dekade == decade])
-        texts_dec = texts_dta.loc[texts_dta.Dekade == decade].sample(frac = 1)
-        j = 1
-        counter = 0
-        while counter < target_size:
-            counter = texts_dec.iloc[0:j,2].sum()
-            j += 1
-        return texts_dec.iloc[0:j,:]
-
-# the following function finds the earliest attestation (the leftmost non-zero value in a series)
-def find_min(series):
-    mask = series > 0
-    return(series.loc[mask].index[0])
-
-# the following function returns (for a given decade) the number of lemmas that are not zero
-def find_types(df, dec):
-    if dec in df.columns.values:
-        return np.nansum(df[dec] > 0)
+batch_size = 64            # nr of sub-corpora that are evaluated together
+workers = None             # nr of worker processes (None: one per core)
+seed = None                # seed of the random streams (None: a fresh seed is drawn and printed)
+aggregate_only = False     # if True, keep only the means and the 90%/98% boundaries instead of every simulation
+export_csv = False         # if True, the results are also written as a csv file (in addition to the binary file)
+adaptive = False           # if True, run batches of simulations until the standard errors of the means and boundaries are below tolerance (nr_sim is the maximum)
+tolerance = 0.005          # the largest accepted Monte Carlo standard error of a Pneo value (adaptive mode)
+adaptive_batch = 1000      # nr of simulations per batch (adaptive mode)
+checkpoint_dir = None      # a directory (e.g. 'data/nis_pneo_checkpoint'): finished chunks are stored there, and an interrupted run resumes from them; it is removed when the run is complete (None: no checkpoints)
+
+if adaptive and aggregate_only:
+    raise ValueError("adaptive mode needs every simulation and cannot be combined with aggregate_only")
+
+run_metrics.params = {'nr_sim': nr_sim, 'target_size': target_size, 'batch_size': batch_size, 'workers': workers,
+                      'aggregate_only': aggregate_only, 'adaptive': adaptive}
+
+run_metrics.stage('index')
+# build the sparse lemma x text count matrix once; every sub-corpus is then evaluated as a boolean mask over the files
+index = pneo_engine.PneoIndex.from_counts(counts)
+
+# the resampler determines once which decades exceed the target size (and are re-sampled) and which decades
+# are always taken as they are. For each decade whose real size in tokens exceeds the target size, a sub-corpus
+# contains a random selection of texts up to the target size; otherwise, it contains the actual corpus
+resampler = pneo_engine.DecadeResampler(texts_dta, decs, target_size, index.files)
+
+# this is the actual Monte Carlo simulation, running nr_sim times.
+# the simulations are distributed in chunks over the worker processes; each simulation draws its re-shuffled sub-corpus
+# from its own random stream (derived from the seed), and for each chunk the engine determines in one go for each lemma
+# the decade of its first occurrence, and for each decade the number of new types and the number of all types.
+# Pneo is simply the ratio of new types and all types
+run_metrics.stage('simulate')
+model = runner.PneoModel(index, resampler, decs_result)
+store = checkpoint.CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+if aggregate_only:
+    # only the running means, variances and the values needed for the boundaries are kept (see aggregate.py)
+    bands, entropy = runner.run(model, nr_sim, seed = seed, workers = workers, chunk_size = batch_size,
+                                store = store, params = {'pattern': 'nis'}, progress = run_metrics.progress,
+                                aggregate = aggregate.StreamingBands(len(decs_result), levels = (0.9, 0.98), capacity = nr_sim))
+    run_metrics.stage('write')
+    bands.save("data/NIS_pneo_global_100_bands.npz")
+    # the summary for the plot scripts (see summary.py): the means and the boundaries for each decade
+    summary.write_pneo(summary.summary_path("data/NIS_pneo_global_100.csv"), bands, decs_result)
+else:
+    if adaptive:
+        # the standard errors are checked after every batch (see bands.mc_errors); nr_sim becomes the number that was needed
+        pneo_values, entropy, errors = runner.run_adaptive(model, tolerance, batch_size = adaptive_batch, max_sim = nr_sim,
+                                                           seed = seed, workers = workers, chunk_size = batch_size,
+                                                           store = store, params = {'pattern': 'nis'},
+                                                           progress = run_metrics.progress)
+        nr_sim = len(pneo_values)
+        print("simulations needed: ", nr_sim)
     else:
-        return 0
-
-# this is the actual Monte Carlo simulation, with a for-loop running nr_sim times
-for n in range(nr_sim):
-    print("Simulation  ",n)
-
-    # create a re-shuffled sub-corpus
-    sub_corpus = pd.concat([shuffle_dec(dec, n) for dec in decs], axis=0)
-
-    # create a new list of tokens that only includes texts that are in the new re-shuffled version
-    suffix_sub = suffix_raw[suffix_raw['Datei'].isin(sub_corpus['Datei'])].loc[:,['Dekade', 'Lemma']]
-    suffix_sub["Wert"] = 1
-
-    # create a table in which the rows are lexemes and the columns are decades
-    suffix_x = pd.pivot_table(suffix_sub, index = 'Lemma', columns = 'Dekade', aggfunc = 'count', fill_value=0)
-    suffix_x.columns = list(suffix_x.columns.levels[1])
-
-    # annotate for first occurrence: for each row (=lemma), find the decade of its first occurrence
-    suffix_x["min"] = suffix_x.apply(find_min, axis = 1)
-
-    # construct a new table with the number of 'min'-values for each decade of interest (how many -nis-words were new in each decade?)
-    new_types_suffix = suffix_x["min"][suffix_x["min"] > 1790].value_counts().to_frame()
-
-    # construct a new dataframe with the decades without new types
-    filt = [dec not in new_types_suffix.index for dec in decs_result]
-    ind = list(compress(list(decs_result), filt))
-    values = [0] * len(ind)
-
-    # merge this new dataframe with the existing one
-    new_types_suffix = pd.concat([new_types_suffix, pd.DataFrame(values, index = ind, columns = ["min"])])
-
-    # get the number of all types for each decade
-    new_types_suffix["all_types"] = [find_types(suffix_x, dec) for dec in list(new_types_suffix.index)]
-
-    # Pneo is simply the ratio of all types and new types
-    new_types_suffix["pneo"] = new_types_suffix["min"]/new_types_suffix["all_types"]
-
-    # for each value in the table: set the according value of the global dataframe
-    for col, value in new_types_suffix["pneo"].iteritems():
-        pneo_global.set_value(n, col, value)
-
-# save dataframe
-pneo_global.to_csv("data/NIS_pneo_global_100.csv", encoding = "utf-8")
+        pneo_values, entropy = runner.run(model, nr_sim, seed = seed, workers = workers, chunk_size = batch_size,
+                                          store = store, params = {'pattern': 'nis'},
+                                          progress = run_metrics.progress)
+
+    run_metrics.stage('write')
+    # save the results in the binary format (Pneo values as float32), together with the parameters and the seed of the run
+    results_io.write_results("data/NIS_pneo_global_100.bin", pneo_values, decs_result, np.float32,
+                             meta = {'pattern': 'nis', 'nr_sim': nr_sim, 'decs': list(decs), 'target_size': target_size,
+                                     'seed': str(entropy)})
+    summary.write_pneo(summary.summary_path("data/NIS_pneo_global_100.csv"), pneo_values, decs_result)
+    if export_csv:
+        pneo_global = pd.DataFrame(pneo_values, columns = decs_result)
+        pneo_global.to_csv("data/NIS_pneo_global_100.csv", encoding = "utf-8")
+# the run is complete: its checkpoint is removed, so that the next run starts anew (with a fresh seed if seed is None)
+if store is not None:
+    store.clear()
+print("seed: ", entropy)   # any single simulation n can be regenerated with runner.regenerate(model, entropy, n)
+run_metrics.finish()
 
 end = timer()
 print("time elapsed: ", end - start)
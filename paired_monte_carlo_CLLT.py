@@ -0,0 +1,80 @@
+# Paired Monte Carlo simulation of the Pneo values of several word formation patterns
+# Instead of running isch_monte_carlo_CLLT.py, nis_monte_carlo_CLLT.py and tum_monte_carlo_CLLT.py one after the other
+# (each of which re-samples its own sub-corpora from texts_dta.csv), this script draws every re-sampled sub-corpus once
+# and evaluates the occurrences of all patterns against it. The simulations of the patterns are paired: simulation n of
+# -isch and simulation n of -nis are based on the same sub-corpus, so the patterns can be compared directly.
+# The results are written to the same files as those of the single scripts (e.g. data/ISCH_pneo_global_100.bin).
+
+# import necessary libraries
+import pandas as pd
+import numpy as np
+from timeit import default_timer as timer
+import pneo_engine
+import ingest
+import runner
+import checkpoint
+import results_io
+import metrics
+import summary
+
+# start the timer
+start =  timer()
+
+# the stages of the run are timed, and the metrics are written to data/metrics (see metrics.py)
+run_metrics = metrics.RunMetrics('paired_pneo')
+
+### set parameters
+patterns = {'isch': ('data/isch.csv', ";"),  # the patterns: name -> (list of occurrences, separator)
+            'nis': ('data/nis.csv', ";"),
+            'tum': ('data/tum.csv', ",")}
+nr_sim = 100             # nr of simulations
+decs = range(1490,1910,10) # decades in the corpus
+decs_result = range(1800,1910,10) # decades of interest
+target_size = 4000000      # maximum corpus size per decade
+batch_size = 64            # nr of sub-corpora that are evaluated together
+workers = None             # nr of worker processes (None: one per core)
+seed = None                # seed of the random streams (None: a fresh seed is drawn and printed)
+export_csv = False         # if True, the results are also written as csv files (in addition to the binary files)
+checkpoint_dir = None      # a directory (e.g. 'data/paired_pneo_checkpoint'): finished chunks are stored there, and an interrupted run resumes from them; it is removed when the run is complete (None: no checkpoints)
+run_metrics.params = {'patterns': list(patterns), 'nr_sim': nr_sim, 'target_size': target_size, 'batch_size': batch_size,
+                      'workers': workers}
+
+run_metrics.stage('load')
+# read the list of texts once, and the list of occurrences of each pattern
+# the lists of occurrences are read in chunks with ingest.py (from the zip archive if there is no csv file) and counted chunk by chunk
+# (text_index.OccurrenceCounts), so that only the counts of the distinct combinations of text, decade and lemma are kept;
+# the counts are cached, and later runs load them until the list changes
+texts_dta  = pd.read_csv('data/texts_dta.csv', sep= ',') # this file contains a line for each text in the corpus, together with the respective decade and the token count
+counts = [ingest.read_counts(path, texts_dta, sep = sep) for path, sep in patterns.values()]
+run_metrics.stage('index')
+indexes = [pneo_engine.PneoIndex.from_counts(pattern_counts) for pattern_counts in counts]
+
+# the resampler only depends on the list of texts, so one resampler serves all patterns
+resampler = pneo_engine.DecadeResampler(texts_dta, decs, target_size, indexes[0].files)
+
+# the actual Monte Carlo simulation: for each chunk of simulations, the sub-corpora are drawn once (as boolean masks over
+# the files) and the Pneo values of all patterns are computed from the same masks
+run_metrics.stage('simulate')
+model = runner.PairedPneoModel(indexes, resampler, decs_result)
+store = checkpoint.CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+pneo_values, entropy = runner.run(model, nr_sim, seed = seed, workers = workers, chunk_size = batch_size,
+                                  store = store, params = {'patterns': list(patterns)}, progress = run_metrics.progress)
+
+run_metrics.stage('write')
+# save the results of each pattern in the binary format, together with the parameters and the seed of the paired run,
+# and the summary for the plot scripts (see summary.py)
+for name, values in zip(patterns, runner.split_paired(pneo_values, len(patterns))):
+    results_io.write_results("data/%s_pneo_global_100.bin" % name.upper(), values, decs_result, np.float32,
+                             meta = {'pattern': name, 'nr_sim': nr_sim, 'decs': list(decs), 'target_size': target_size,
+                                     'seed': str(entropy), 'paired': list(patterns)})
+    summary.write_pneo(summary.summary_path("data/%s_pneo_global_100.csv" % name.upper()), values, decs_result)
+    if export_csv:
+        pd.DataFrame(values, columns = decs_result).to_csv("data/%s_pneo_global_100.csv" % name.upper(), encoding = "utf-8")
+# the run is complete: its checkpoint is removed, so that the next run starts anew (with a fresh seed if seed is None)
+if store is not None:
+    store.clear()
+print("seed: ", entropy)   # any single paired simulation n can be regenerated with runner.regenerate(model, entropy, n)
+run_metrics.finish()
+
+end = timer()
+print("time elapsed: ", end - start)
@@ -0,0 +1,72 @@
+# Paired Säily simulations of several word formation patterns
+# Like säily_isch_CLLT.py and säily_nis_CLLT.py, but every random permutation of the texts is drawn once and the types of
+# all patterns are counted along it; the token counts of each permutation are also computed only once. The simulations of
+# the patterns are paired: simulation n of -isch and simulation n of -nis read the texts in the same order.
+# The results are written to the same files as those of the single scripts (e.g. data/isch_types_over_tokens_total.bin).
+
+import pandas as pd
+import numpy as np
+from timeit import default_timer as timer
+import text_index
+import ingest
+import runner
+import checkpoint
+import results_io
+import metrics
+import summary
+
+# Timer
+start =  timer()
+
+# the stages of the run are timed, and the metrics are written to data/metrics (see metrics.py)
+run_metrics = metrics.RunMetrics('paired_saily')
+
+# set parameters
+patterns = {'isch': ('data/isch_18c.csv', ";"),  # the patterns: name -> (list of occurrences, separator)
+            'nis': ('data/nis_18c.csv', ";")}
+nr_sim = 100            # nr of simulations
+xnew = np.arange(0, 15000000, 100000) # intervals (in running words) at which the number of types is determined
+workers = None          # nr of worker processes (None: one per core)
+seed = None             # seed of the random streams (None: a fresh seed is drawn and printed)
+export_csv = False      # if True, the results are also written as csv files (in addition to the binary files)
+checkpoint_dir = None      # a directory (e.g. 'data/paired_saily_checkpoint'): finished chunks are stored there, and an interrupted run resumes from them; it is removed when the run is complete (None: no checkpoints)
+run_metrics.params = {'patterns': list(patterns), 'nr_sim': nr_sim, 'workers': workers}
+
+run_metrics.stage('load')
+# Load list of files, and build the index of the texts with their types for each pattern
+# the lists of occurrences are read in chunks with ingest.py (from the zip archive if there is no csv file) and counted chunk by chunk
+# (text_index.OccurrenceCounts), so that only the counts of the distinct combinations of text, decade and lemma are kept;
+# the counts are cached, and later runs load them until the list changes
+texts_dta  = pd.read_csv('data/dta_texts_18c.csv', sep= ',') # this file includes the filename, the decade the text was printed, and the total tokens
+counts = [ingest.read_counts(path, texts_dta, sep = sep) for path, sep in patterns.values()]
+run_metrics.stage('index')
+texts_indexes = [text_index.TextIndex.from_counts(texts_dta, pattern_counts) for pattern_counts in counts]
+for name, texts_index in zip(patterns, texts_indexes):
+    texts_index.save("data/%s_texts_index.npz" % name)
+indexes = [texts_index.saily_index() for texts_index in texts_indexes]
+
+# the simulations: for each chunk, the permutations and the token grid are computed once, the types for every pattern
+run_metrics.stage('simulate')
+model = runner.PairedSailyModel(indexes, xnew)
+store = checkpoint.CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+result, entropy = runner.run(model, nr_sim, seed = seed, workers = workers, store = store, params = {'patterns': list(patterns)},
+                             progress = run_metrics.progress)
+
+run_metrics.stage('write')
+# save the results of each pattern in the binary format (type counts as int32), together with the parameters and the seed
+# and the summary for the plot scripts (see summary.py)
+for name, values, texts_index in zip(patterns, runner.split_paired(result, len(patterns)), texts_indexes):
+    results_io.write_results("data/%s_types_over_tokens_total.bin" % name, values, range(len(xnew)), np.int32,
+                             meta = {'pattern': name, 'nr_sim': nr_sim, 'xnew': xnew.tolist(), 'fused': True,
+                                     'seed': str(entropy), 'paired': list(patterns)})
+    summary.write_saily(summary.summary_path("data/%s_types_over_tokens_total.csv" % name), values, xnew, texts_index)
+    if export_csv:
+        pd.DataFrame(values).to_csv("data/%s_types_over_tokens_total.csv" % name, encoding = "utf-8")
+# the run is complete: its checkpoint is removed, so that the next run starts anew (with a fresh seed if seed is None)
+if store is not None:
+    store.clear()
+print("seed: ", entropy)   # any single paired simulation n can be regenerated with runner.regenerate(model, entropy, n)
+run_metrics.finish()
+
+end = timer()
+print("time elapsed: ", end - start)
@@ -0,0 +1,271 @@
+# Cached pipeline for the simulations of a word formation pattern (see pipeline_CLLT.py)
+# The work for one pattern is split into stages that depend on each other:
+#   ingest -> index -> simulate -> aggregate -> plot
+# ingest reads the list of texts and the list of occurrences (see ingest.py) and counts the occurrences (text_index.OccurrenceCounts),
+# index builds the index of the texts with their types, simulate runs the Säily or Pneo simulations, aggregate computes
+# the summary for the plots (the means and the boundaries of the confidence bands, see summary.py), and plot draws them.
+# Every stage writes its output into its own directory in the cache (data/cache/<stage>_<key>). The key is a hash of the
+# parameters that the stage uses and of the keys of the stages it depends on; for ingest, it includes a hash of the content
+# of the input files. A stage whose output is already in the cache is not run again: changing only a plotting parameter
+# re-draws the plot, but does not repeat the simulations.
+# With a metrics.RunMetrics, the stages that are run are timed, and the simulations report their progress.
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+
+import aggregate
+import bands
+import checkpoint
+import ingest
+import pneo_engine
+import results_io
+import runner
+import summary
+import text_index
+
+# bump the version of a stage when its code changes the output, so that old cache entries are not used any more
+VERSION = 2
+
+
+# the parameters of a pattern config that each stage uses (the rest of the config does not affect its output)
+def _ingest_params(config):
+    return {'texts': config['texts'], 'occurrences': config['occurrences'], 'sep': config.get('sep'),
+            'content': [_file_hash(ingest.source(config['texts'])), _file_hash(ingest.source(config['occurrences']))]}
+
+
+def _index_params(config):
+    return {}
+
+
+def _simulate_params(config):
+    params = {'method': config['method'], 'nr_sim': config['nr_sim'], 'seed': config.get('seed'),
+              'aggregate_only': config.get('aggregate_only', False)}
+    if params['aggregate_only']:
+        params.update(_aggregate_params(config))
+    if config['method'] == 'saily':
+        params['xnew'] = np.asarray(config['xnew']).tolist()
+    else:
+        params.update(decs=list(config['decs']), decs_result=list(config['decs_result']), target_size=config['target_size'])
+    return params
+
+
+def _aggregate_params(config):
+    params = {'levels': list(config.get('levels', (0.98, 0.9)))}
+    if config['method'] == 'saily':
+        params['decs'] = list(config.get('decs', []))
+    return params
+
+
+def _plot_params(config):
+    return {'plot': config.get('plot', {}), 'decs': list(config.get('decs', []))}
+
+
+# the hash of the content of a file
+def _file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ingest: the list of texts and the counted occurrences
+def ingest_stage(config, inputs, out):
+    texts_dta = pd.read_csv(config['texts'], sep = ',')
+    # the list of occurrences is read and counted in chunks, so it does not have to fit in memory
+    chunks = ingest.read_chunks(config['occurrences'], sep = config.get('sep'), chunk_size = config.get('chunk_size', 1000000))
+    text_index.OccurrenceCounts.from_chunks(texts_dta, chunks).save(os.path.join(out, 'counts.npz'))
+    texts_dta[['Datei', 'Dekade', 'Freq']].to_csv(os.path.join(out, 'texts.csv'), index = False)
+
+
+# index: the texts with their types (the same file that the Säily scripts write, e.g. data/isch_texts_index.npz)
+def index(config, inputs, out):
+    texts_dta = pd.read_csv(os.path.join(inputs['ingest'], 'texts.csv'))
+    counts = text_index.OccurrenceCounts.load(os.path.join(inputs['ingest'], 'counts.npz'))
+    text_index.TextIndex.from_counts(texts_dta, counts).save(os.path.join(out, 'texts_index.npz'))
+
+
+# the runner model of a pattern config, built from the output of ingest and index
+def build_model(config, inputs):
+    if config['method'] == 'saily':
+        texts_index = text_index.TextIndex.load(os.path.join(inputs['index'], 'texts_index.npz'))
+        return runner.SailyModel(texts_index.saily_index(), np.asarray(config['xnew']))
+    texts_dta = pd.read_csv(os.path.join(inputs['ingest'], 'texts.csv'))
+    pneo_index = pneo_engine.PneoIndex.from_counts(text_index.OccurrenceCounts.load(os.path.join(inputs['ingest'], 'counts.npz')))
+    resampler = pneo_engine.DecadeResampler(texts_dta, config['decs'], config['target_size'], pneo_index.files)
+    return runner.PneoModel(pneo_index, resampler, config['decs_result'])
+
+
+# the grid points of the results: the token intervals (Säily) or the decades of interest (Pneo)
+def grid(config):
+    return list(range(len(config['xnew']))) if config['method'] == 'saily' else list(config['decs_result'])
+
+
+# simulate: the simulation results (results.bin, one row per simulation) or their aggregate (bands.npz).
+# the finished chunks are checkpointed in the work directory of the stage, so an interrupted run resumes
+def simulate(config, inputs, out, work, workers=None, progress=None):
+    model = build_model(config, inputs)
+    store = checkpoint.CheckpointStore(os.path.join(work, 'checkpoint'))
+    params = {'pattern': config['name'], 'method': config['method']}
+    chunk_size = config.get('batch_size', 64 if config['method'] == 'pneo' else 256)
+    if config.get('aggregate_only', False):
+        result, entropy = runner.run(model, config['nr_sim'], seed = config.get('seed'), workers = workers,
+                                     chunk_size = chunk_size, store = store, params = params, progress = progress,
+                                     aggregate = aggregate.StreamingBands(len(grid(config)), levels = _aggregate_params(config)['levels'],
+                                                                          capacity = config['nr_sim']))
+        result.save(os.path.join(out, 'bands.npz'))
+    else:
+        result, entropy = runner.run(model, config['nr_sim'], seed = config.get('seed'), workers = workers,
+                                     chunk_size = chunk_size, store = store, params = params, progress = progress)
+        dtype = np.int32 if config['method'] == 'saily' else np.float32
+        results_io.write_results(os.path.join(out, 'results.bin'), result, grid(config), dtype,
+                                 meta = dict(_simulate_params(config), pattern = config['name'], seed = str(entropy)))
+    print("seed: ", entropy)
+
+
+# the output of simulate: a data frame with one row per simulation or an aggregate.StreamingBands
+def load_simulations(path):
+    if os.path.exists(os.path.join(path, 'results.bin')):
+        return results_io.read_results(os.path.join(path, 'results.bin')).to_frame()
+    return aggregate.StreamingBands.load(os.path.join(path, 'bands.npz'))
+
+
+# aggregate: the summary of the simulations (summary.npz, see summary.py): the mean and the lower and upper boundaries of
+# each level at each grid point, and for the Säily simulations the actual and the mean number of types per decade
+def aggregate_stage(config, inputs, out):
+    sims = load_simulations(inputs['simulate'])
+    levels = _aggregate_params(config)['levels']
+    if config['method'] == 'saily':
+        texts_index = text_index.TextIndex.load(os.path.join(inputs['index'], 'texts_index.npz'))
+        result = summary.saily_summary(sims, np.asarray(config['xnew']), texts_index, config.get('decs'), levels)
+    else:
+        result = summary.pneo_summary(sims, config['decs_result'], levels)
+    np.savez(os.path.join(out, 'summary.npz'), **result)
+
+
+def load_summary(path):
+    return summary.load(os.path.join(path, 'summary.npz'))
+
+
+# plot: the mean and the confidence bands (plot.png); for the Säily simulations also the actual values of the decades
+def plot(config, inputs, out):
+    options = dict({'figsize': (6, 6) if config['method'] == 'saily' else (6, 3), 'dpi': 1200, 'ylim': None,
+                    'colours': {0.98: 'grey', 0.9: 'dimgrey'}}, **config.get('plot', {}))
+    data = load_summary(inputs['aggregate'])
+    mean, conf_bands = data['mean'], summary.conf_bands(data)
+
+    fig = plt.figure(figsize = options['figsize'])
+    ax1 = fig.add_subplot(111)
+    ax1.set_title(options.get('title', '-' + config['name']), style = 'italic', family = 'serif')
+    if config['method'] == 'saily':
+        x = np.asarray(config['xnew'])
+        ax1.plot(data['tokens_dec'], data['types_dec'], '.', c = "black")
+        plt.ylabel("Types", fontsize=12)
+        plt.xlabel("Running words (millions)", fontsize=12)
+        ax1.set_xlim(0, x[-1])
+        ax1.set_xticks(ax1.get_xticks(), ["%g" % tick for tick in ax1.get_xticks() / 1000000])
+    else:
+        x = list(config['decs_result'])
+        plt.ylabel("$P_{neo}$", fontsize=16)
+        ax1.set_xlim(x[0], x[-1])
+    ax1.plot(x, mean, linewidth = 0.7, color = "black")
+    ax1.grid()
+    if options['ylim'] is not None:
+        ax1.set_ylim(*options['ylim'])
+    bands.fill_bands(ax1, x, conf_bands, {float(conf): colour for conf, colour in options['colours'].items()})
+
+    # proxy artists
+    p1 = mpatches.Rectangle((0, 0), 1, 1, fc="white", edgecolor = "dimgrey")
+    p5 = mpatches.Rectangle((0, 0), 1, 1, fc="lightgrey", edgecolor = "dimgrey")
+    p = mpatches.Rectangle((0, 0), 1, 1, fc=[0.6,0.6,0.6], edgecolor = "dimgrey")
+    ax1.legend([p,p5,p1], ["p > 0.05", "p < 0.05", "p < 0.01"], loc = 4)
+
+    fig.tight_layout(pad = 2)
+    fig.savefig(os.path.join(out, 'plot.png'), dpi = options['dpi'])
+    plt.close(fig)
+
+
+# the stages: name -> (stages it depends on, parameters, function)
+STAGES = {
+    'ingest': ([], _ingest_params, ingest_stage),
+    'index': (['ingest'], _index_params, index),
+    'simulate': (['ingest', 'index'], _simulate_params, simulate),
+    'aggregate': (['index', 'simulate'], _aggregate_params, aggregate_stage),
+    'plot': (['aggregate'], _plot_params, plot),
+}
+
+
+class Pipeline:
+    # config: the pattern config (see pipeline_CLLT.py); workers: nr of worker processes for the simulations;
+    # run_metrics: a metrics.RunMetrics that times the stages (None: no metrics)
+    def __init__(self, config, cache_dir='data/cache', workers=None, run_metrics=None):
+        self.config = config
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.run_metrics = run_metrics
+        self.keys = {}
+
+    # the key of a stage: a hash of its parameters and of the keys of the stages it depends on
+    def key(self, stage):
+        if stage not in self.keys:
+            depends, params, function = STAGES[stage]
+            description = {'stage': stage, 'version': VERSION, 'params': params(self.config),
+                           'depends': {name: self.key(name) for name in depends}}
+            self.keys[stage] = hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return self.keys[stage]
+
+    def path(self, stage):
+        return os.path.join(self.cache_dir, '%s_%s' % (stage, self.key(stage)))
+
+    def cached(self, stage):
+        return os.path.exists(os.path.join(self.path(stage), 'stage.json'))
+
+    # run a stage (and the stages it depends on, if they are not in the cache) and return the directory of its output
+    def run(self, stage='plot'):
+        path = self.path(stage)
+        if self.cached(stage):
+            print("%s %s: cached (%s)" % (self.config['name'], stage, path))
+            return path
+        depends, params, function = STAGES[stage]
+        inputs = {name: self.run(name) for name in depends}
+
+        # the output is written to a work directory first and only moved into place when the stage is complete;
+        # the work directory of simulate keeps the checkpoints of an interrupted run
+        print("%s %s: running" % (self.config['name'], stage))
+        if self.run_metrics is not None:
+            self.run_metrics.stage(stage)
+        work = path + '.work'
+        out = os.path.join(work, 'out')
+        shutil.rmtree(out, ignore_errors=True)
+        os.makedirs(out)
+        if stage == 'simulate':
+            function(self.config, inputs, out, work, workers=self.workers,
+                     progress=self.run_metrics.progress if self.run_metrics is not None else None)
+        else:
+            function(self.config, inputs, out)
+        with open(os.path.join(out, 'stage.json'), 'w', encoding='utf-8') as f:
+            json.dump({'stage': stage, 'pattern': self.config['name'], 'params': params(self.config),
+                       'depends': {name: self.key(name) for name in depends}}, f, indent=1, default=str)
+        os.replace(out, path)
+        shutil.rmtree(work)
+        return path
+
+    # copy the results and their summary to the place given in the config ('results'), where the plot scripts expect them,
+    # and the plot to 'plot_file'
+    def publish(self):
+        if self.config.get('results'):
+            simulations = self.run('simulate')
+            for name in os.listdir(simulations):
+                if name in ('results.bin', 'bands.npz'):
+                    target = self.config['results'] if name == 'results.bin' else os.path.splitext(self.config['results'])[0] + '_bands.npz'
+                    shutil.copyfile(os.path.join(simulations, name), target)
+            shutil.copyfile(os.path.join(self.run('aggregate'), 'summary.npz'), summary.summary_path(self.config['results']))
+        if self.config.get('plot_file'):
+            shutil.copyfile(os.path.join(self.run('plot'), 'plot.png'), self.config['plot_file'])
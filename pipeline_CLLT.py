@@ -0,0 +1,68 @@
+# One entry point for the simulations of all word formation patterns
+# Instead of running the Säily scripts and the Monte Carlo scripts one by one (which differ only in their input files,
+# the separator and the names of the output files), each pattern is described by a config, and the pipeline (pipeline.py)
+# runs the stages ingest -> index -> simulate -> aggregate -> plot for it.
+# The output of every stage is cached in data/cache under a hash of its parameters and inputs, so a second run with the
+# same config does nothing, and a change of a plotting parameter only re-draws the plot.
+# Patterns whose list of occurrences (or of texts) is not in data/ are skipped.
+
+import os
+import numpy as np
+from timeit import default_timer as timer
+import ingest
+import pipeline
+import metrics
+
+# Timer
+start =  timer()
+
+# set parameters
+nr_sim = 100               # nr of simulations
+workers = None             # nr of worker processes (None: one per core)
+seed = None                # seed of the random streams (None: a fresh seed is drawn and printed)
+cache_dir = 'data/cache'   # the outputs of all stages are stored here
+run_patterns = ['isch_saily', 'nis_saily', 'isch_pneo', 'nis_pneo', 'tum_pneo'] # the configs that are run (if their data are there)
+
+# the plots of the pipeline are simple previews; they are saved as plots/pipeline_<config>.png, so that they do not
+# replace the figures of the paper (plot_1_CLLT.py ... plot_5_CLLT.py, render_CLLT.py)
+# the Säily simulations: 18th century texts, the number of types at the intervals xnew (in running words)
+saily = {'method': 'saily', 'texts': 'data/dta_texts_18c.csv', 'nr_sim': nr_sim, 'seed': seed,
+         'xnew': np.arange(0, 15000000, 100000), 'decs': range(1800,1900,10)}
+
+# the Pneo simulations: the whole corpus, re-sampled up to target_size running words per decade
+pneo = {'method': 'pneo', 'texts': 'data/texts_dta.csv', 'nr_sim': nr_sim, 'seed': seed,
+        'decs': range(1490,1910,10), 'decs_result': range(1800,1910,10), 'target_size': 4000000, 'batch_size': 64}
+
+configs = {
+    'isch_saily': dict(saily, name = 'isch', occurrences = 'data/isch_18c.csv', sep = ';',
+                       results = 'data/isch_types_over_tokens_total.bin', plot_file = 'plots/pipeline_isch_saily.png',
+                       plot = {'ylim': (0, 2000)}),
+    'nis_saily': dict(saily, name = 'nis', occurrences = 'data/nis_18c.csv', sep = ';',
+                      results = 'data/nis_types_over_tokens_total.bin', plot_file = 'plots/pipeline_nis_saily.png',
+                      plot = {'ylim': (0, 80)}),
+    'isch_pneo': dict(pneo, name = 'isch', occurrences = 'data/isch.csv', sep = ';',
+                      results = 'data/ISCH_pneo_global_100.bin', plot_file = 'plots/pipeline_isch_pneo.png',
+                      plot = {'ylim': (0, 0.2)}),
+    'nis_pneo': dict(pneo, name = 'nis', occurrences = 'data/nis.csv', sep = ';',
+                     results = 'data/NIS_pneo_global_100.bin', plot_file = 'plots/pipeline_nis_pneo.png',
+                     plot = {'ylim': (0, 0.2)}),
+    'tum_pneo': dict(pneo, name = 'tum', occurrences = 'data/tum.csv', sep = ',',
+                     results = 'data/TUM_pneo_global_100.bin', plot_file = 'plots/pipeline_tum_pneo.png',
+                     plot = {'ylim': (0, 0.5)}),
+}
+
+for name in run_patterns:
+    missing = [path for path in (configs[name]['occurrences'], configs[name]['texts']) if not os.path.exists(ingest.source(path))]
+    if missing:
+        print("skipping %s: %s not found" % (name, ", ".join(missing)))
+        continue
+    # the stages that are run (not those taken from the cache) are timed, and the metrics are written to data/metrics
+    run_metrics = metrics.RunMetrics('pipeline_' + name, params = {'nr_sim': nr_sim, 'workers': workers})
+    pipe = pipeline.Pipeline(configs[name], cache_dir = cache_dir, workers = workers, run_metrics = run_metrics)
+    pipe.run('plot')
+    run_metrics.stage('publish')
+    pipe.publish()  # copy the results to data/, where the plot scripts expect them, and the preview plot to plots/
+    run_metrics.finish()
+
+end = timer()
+print("time elapsed: ", end - start)
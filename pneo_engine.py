@@ -0,0 +1,207 @@
+# Vectorized engine for the Pneo simulations (isch_monte_carlo_CLLT.py, nis_monte_carlo_CLLT.py, tum_monte_carlo_CLLT.py)
+# Instead of filtering the list of occurrences and building a pivot table for every simulation, the occurrences
+# are turned into a sparse lemma x text count matrix once. Each re-sampled sub-corpus is then just a boolean mask over the files,
+# and the lemma x decade presence of many simulations is computed at once with a single sparse matrix product.
+# The decade of first occurrence, the number of new types and the number of all types per decade follow from array reductions.
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import text_index
+
+
+# the lemma x text count matrix.
+# A 'slot' is a combination of a file and a decade in the list of occurrences (normally each file has exactly one decade).
+# counts[lemma, slot] is the number of occurrences of the lemma in the slot; slot_file and slot_dec map the slots to
+# the files (the position in files) and to the decades (the position in decades).
+# occ_count (optional): the number of occurrences that each entry stands for (one if not given).
+class PneoIndex:
+    def __init__(self, files, occ_file, occ_dec, occ_lemma, lemmas, decades, occ_count=None):
+        self.files = np.asarray(files, dtype=object)
+        self.lemmas = np.asarray(lemmas, dtype=object)
+        self.decades = np.asarray(decades)
+        self.nr_files = len(self.files)
+        self.nr_lemmas = len(self.lemmas)
+        self.nr_decades = len(self.decades)
+
+        slot_key, slot = np.unique(np.asarray(occ_file, dtype=np.int64) * self.nr_decades + occ_dec, return_inverse=True)
+        self.slot_file = slot_key // self.nr_decades
+        self.slot_dec = slot_key % self.nr_decades
+        self.nr_slots = len(slot_key)
+        occ_count = np.ones(len(slot), dtype=np.int64) if occ_count is None else np.asarray(occ_count, dtype=np.int64)
+        self.counts = sparse.csr_matrix((occ_count, (np.asarray(occ_lemma), slot.ravel())),
+                                        shape=(self.nr_lemmas, self.nr_slots))
+
+    # build the index from the counted occurrences (text_index.OccurrenceCounts)
+    @classmethod
+    def from_counts(cls, counts):
+        return cls(counts.files, counts.occ_file, counts.occ_dec, counts.occ_lemma, counts.lemmas, counts.decades,
+                   counts.occ_count)
+
+    # build the index from the metadata (texts_dta: Datei, Dekade, Freq) and the list of occurrences (Dekade, Lemma, Datei).
+    # occurrences in files that are not part of texts_dta can never be sampled and are left out.
+    @classmethod
+    def from_frames(cls, texts_dta, suffix_raw):
+        return cls.from_counts(text_index.OccurrenceCounts.from_frames(texts_dta, suffix_raw))
+
+    # the following function turns a list of sub-corpora (each a list of filenames, e.g. sub_corpus['Datei'])
+    # into a boolean mask with one row per sub-corpus and one column per file
+    def file_mask(self, sub_corpora):
+        masks = np.zeros((len(sub_corpora), self.nr_files), dtype=bool)
+        for n, sub_files in enumerate(sub_corpora):
+            masks[n, pd.Index(self.files).get_indexer(pd.unique(np.asarray(sub_files, dtype=object)))] = True
+        return masks
+
+
+# the re-sampling of the corpus (shuffle_dec in the Monte Carlo scripts).
+# For each decade whose real size exceeds the target size, the texts are shuffled and taken in this order until the
+# target size is reached - plus one more text, as in the original while-loop. All other decades are taken as they are.
+# The decade groups and the fixed decades are determined once; each call of draw() re-samples a whole batch of
+# sub-corpora and returns them as a boolean mask over the files (files: the files of the PneoIndex).
+class DecadeResampler:
+    def __init__(self, texts_dta, decs, target_size, files):
+        dekade = texts_dta['Dekade'].values
+        freq = texts_dta['Freq'].values.astype(np.int64)
+        in_decs = np.isin(dekade, list(decs))
+        real_size = pd.Series(freq[in_decs]).groupby(dekade[in_decs]).sum()
+        oversized = real_size.index[real_size > target_size].values
+
+        # rows of texts_dta that are always part of the sub-corpus, and the rows of the oversized decades (sorted by decade)
+        self.fixed_rows = np.nonzero(in_decs & ~np.isin(dekade, oversized))[0]
+        rows = np.nonzero(np.isin(dekade, oversized))[0]
+        self.rows = rows[np.argsort(dekade[rows], kind='stable')]
+        self.group, self.group_sizes = np.unique(dekade[self.rows], return_inverse=True, return_counts=True)[1:]
+        self.group = self.group.ravel()
+        self.group_starts = np.cumsum(self.group_sizes) - self.group_sizes
+        self.freq = freq[self.rows]
+        self.target_size = target_size
+
+        # map the rows of texts_dta to the files (a file may occur in more than one row); the files of the fixed rows
+        # are part of every sub-corpus
+        self.row_file = pd.Index(files).get_indexer(texts_dta['Datei'])
+        self.nr_rows = len(self.row_file)
+        self.nr_files = len(files)
+        self.fixed_files = np.zeros(self.nr_files, dtype=bool)
+        self.fixed_files[self.row_file[self.fixed_rows]] = True
+
+    # draw a batch of random keys, one row per simulation and one column per text in the oversized decades
+    def random_keys(self, rng, nr_sim):
+        return rng.random((nr_sim, len(self.rows)))
+
+    # re-sample nr_sim sub-corpora. The texts are shuffled within their decades by sorting them by (decade, random key);
+    # the cut-off in each decade is the number of texts whose cumulative token count stays below the target size, plus two
+    # (the text that reaches the target size and the one extra text of the original while-loop).
+    def draw(self, rng, nr_sim=1, keys=None):
+        keys = self.random_keys(rng, nr_sim) if keys is None else np.atleast_2d(keys)
+        nr_sim = keys.shape[0]
+        order = np.argsort(self.group + keys, axis=1)
+        cumulative = np.cumsum(self.freq[order], axis=1)
+        starts = self.group_starts[self.group]
+        before = np.concatenate((np.zeros((nr_sim, 1), dtype=np.int64), cumulative[:, :-1]), axis=1)
+        within = cumulative - before[:, starts]
+        below = np.add.reduceat(within < self.target_size, self.group_starts, axis=1) if len(self.rows) > 0 else within
+        cut_off = np.minimum(below + 2, self.group_sizes)
+
+        # position of each text within its decade in the shuffled order, then compare with the cut-off of its decade;
+        # the files of the selected texts are added to the files of the fixed rows
+        position = np.empty_like(order)
+        position[np.arange(nr_sim)[:, None], order] = np.arange(len(self.rows)) - starts
+        masks = np.tile(self.fixed_files, (nr_sim, 1))
+        sim, selected = np.nonzero(position < cut_off[:, self.group])
+        masks[sim, self.row_file[self.rows[selected]]] = True
+        return masks
+
+
+# the part of the sub-corpora that is the same in every simulation: the texts of the decades at or below the target size
+# are always taken as they are. For the slots of their files, the presence of each lemma in each decade and the decade of
+# its earliest attestation are computed once; each simulation only adds the slots of the files of the re-sampled decades.
+class FixedPart:
+    def __init__(self, index, resampler):
+        fixed_files = resampler.fixed_files
+        variable_files = np.zeros(resampler.nr_files, dtype=bool)
+        variable_files[resampler.row_file[resampler.rows]] = True
+        variable_files &= ~fixed_files
+
+        # lemma x decade presence in the fixed slots, the earliest decade of each lemma (nr_decades: none) and the number
+        # of types per decade
+        fixed_slots = np.nonzero(fixed_files[index.slot_file])[0]
+        decade_of_slot = sparse.csr_matrix((np.ones(len(fixed_slots), dtype=np.int64), (fixed_slots, index.slot_dec[fixed_slots])),
+                                           shape=(index.nr_slots, index.nr_decades))
+        self.presence = (index.counts @ decade_of_slot).toarray() > 0
+        self.first = np.where(self.presence.any(axis=1), np.argmax(self.presence, axis=1), index.nr_decades)
+        self.all_types = self.presence.sum(axis=0)
+
+        # the slots of the files that are re-sampled
+        self.slots = np.nonzero(variable_files[index.slot_file])[0]
+        self.counts = index.counts[:, self.slots].tocsr()
+        self.slot_file = index.slot_file[self.slots]
+        self.slot_dec = index.slot_dec[self.slots]
+
+
+# the following function returns, for a batch of sub-corpora (a boolean file mask with one row per simulation),
+# the number of new types (lemmas that occur for the first time) and the number of all types for each decade.
+# Both arrays have one row per simulation and one column per decade in index.decades.
+# With the fixed part of the sub-corpora (fixed: a FixedPart), only the slots of the re-sampled files are evaluated.
+def decade_counts(index, masks, fixed=None):
+    if fixed is not None:
+        return _decade_counts_fixed(index, masks, fixed)
+    masks = np.atleast_2d(masks)
+    nr_sim = masks.shape[0]
+    nr_dec = index.nr_decades
+
+    # slot x (simulation, decade) matrix: a slot contributes to its own decade in every simulation that contains its file
+    sim, slot = np.nonzero(masks[:, index.slot_file])
+    selection = sparse.csc_matrix((np.ones(len(slot), dtype=np.int64), (slot, sim * nr_dec + index.slot_dec[slot])),
+                                  shape=(index.nr_slots, nr_sim * nr_dec))
+
+    # lemma x (simulation, decade) presence
+    presence = (index.counts @ selection).tocoo()
+    lemma, column = presence.row.astype(np.int64), presence.col.astype(np.int64)  # same type as first (fast np.minimum.at)
+    all_types = np.bincount(column, minlength=nr_sim * nr_dec).reshape(nr_sim, nr_dec)
+
+    # decade of first occurrence for each lemma in each simulation
+    first = np.full(nr_sim * index.nr_lemmas, nr_dec, dtype=np.int64)
+    np.minimum.at(first, (column // nr_dec) * index.nr_lemmas + lemma, column % nr_dec)
+    first = first.reshape(nr_sim, index.nr_lemmas)
+    attested = first < nr_dec
+    offsets = (np.arange(nr_sim) * nr_dec)[:, None]
+    new_types = np.bincount((first + offsets)[attested], minlength=nr_sim * nr_dec).reshape(nr_sim, nr_dec)
+    return new_types, all_types
+
+
+def _decade_counts_fixed(index, masks, fixed):
+    masks = np.atleast_2d(masks)
+    nr_sim = masks.shape[0]
+    nr_dec = index.nr_decades
+
+    # the re-sampled slots in each simulation, as in decade_counts
+    sim, slot = np.nonzero(masks[:, fixed.slot_file])
+    selection = sparse.csc_matrix((np.ones(len(slot), dtype=np.int64), (slot, sim * nr_dec + fixed.slot_dec[slot])),
+                                  shape=(len(fixed.slots), nr_sim * nr_dec))
+    presence = (fixed.counts @ selection).tocoo()
+    lemma, column = presence.row.astype(np.int64), presence.col.astype(np.int64)
+
+    # a type counts for a decade if it is present in the fixed part or (only then added) in the re-sampled part
+    added = ~fixed.presence[lemma, column % nr_dec]
+    all_types = fixed.all_types[None, :] + np.bincount(column[added], minlength=nr_sim * nr_dec).reshape(nr_sim, nr_dec)
+
+    # the decade of first occurrence: the earlier of the fixed part and the re-sampled part
+    first = np.tile(fixed.first, nr_sim)
+    np.minimum.at(first, (column // nr_dec) * index.nr_lemmas + lemma, column % nr_dec)
+    first = first.reshape(nr_sim, index.nr_lemmas)
+    attested = first < nr_dec
+    offsets = (np.arange(nr_sim) * nr_dec)[:, None]
+    new_types = np.bincount((first + offsets)[attested], minlength=nr_sim * nr_dec).reshape(nr_sim, nr_dec)
+    return new_types, all_types
+
+
+# the following function returns the Pneo values (new types / all types) for the decades of interest,
+# with one row per simulation and one column per decade in decs_result (NaN where a decade has no types at all)
+def pneo(index, masks, decs_result, fixed=None):
+    new_types, all_types = decade_counts(index, masks, fixed)
+    columns = pd.Index(index.decades).get_indexer(list(decs_result))
+    new_types = np.where(columns >= 0, new_types[:, columns], 0)
+    all_types = np.where(columns >= 0, all_types[:, columns], 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return new_types / all_types
@@ -0,0 +1,85 @@
+# Analytic rarefaction for the Säily curves
+# For a random order of the texts, the expected number of distinct lemmas after k texts follows from the number of
+# texts that contain each lemma (its text frequency d): a lemma has not been seen after k of N texts with probability
+#   q(d, k) = C(N - d, k) / C(N, k)
+# so that the expected number of types is the sum of 1 - q(d, k) over all lemmas (the classic rarefaction formula).
+# The variance needs, for each pair of lemmas, the number of texts that contain at least one of them (the size of the
+# union u of their texts): both have not been seen with probability q(u, k). Only the histograms of d and u are needed,
+# and the histogram of u follows from the histogram of d plus a correction for the pairs of lemmas that occur together.
+# The curves over k (texts) are mapped onto the token axis with the mean number of tokens per text.
+
+import numpy as np
+from scipy import sparse
+from scipy.special import gammaln
+
+
+# the text frequency of each lemma: the number of texts it occurs in (index: text_index.TextIndex)
+def text_frequencies(index):
+    return np.bincount(index.lemma_ids, minlength=index.nr_lemmas)
+
+
+# q(u, k) for all sizes u = 0, ..., nr_sizes-1 and k = 0, ..., nr_texts: one row per size, one column per k
+def unseen_probability(nr_texts, nr_sizes):
+    u = np.arange(nr_sizes)[:, None]
+    k = np.arange(nr_texts + 1)[None, :]
+    possible = k <= nr_texts - u
+    with np.errstate(invalid='ignore'):
+        log_q = (gammaln(np.maximum(nr_texts - u, 0) + 1) - gammaln(np.maximum(nr_texts - u - k, 0) + 1)
+                 - gammaln(nr_texts + 1) + gammaln(nr_texts - k + 1))
+    return np.where(possible, np.exp(log_q), 0.0)
+
+
+# the histogram of the union sizes over all ordered pairs of different lemmas that occur in the corpus.
+# frequencies: the text frequency of every lemma of the index (text_frequencies), indexed by the lemma ids
+def union_histogram(index, frequencies):
+    nr_texts = index.nr_texts
+    seen = frequencies[frequencies > 0]
+    d_hist = np.bincount(seen, minlength=nr_texts + 1)
+    # pairs of lemmas that never occur in the same text: u = d_l + d_m
+    hist = np.convolve(d_hist, d_hist)
+    hist[:2 * nr_texts + 1] -= np.bincount(2 * seen, minlength=2 * nr_texts + 1)
+    # pairs of lemmas that occur together in d_lm texts: u = d_l + d_m - d_lm
+    occurrence = sparse.csr_matrix((np.ones(len(index.lemma_ids), dtype=np.int64), (index.pair_text(), index.lemma_ids)),
+                                   shape=(nr_texts, index.nr_lemmas))
+    together = sparse.triu(occurrence.T @ occurrence, k=1).tocoo()
+    joint = frequencies[together.row] + frequencies[together.col]
+    np.subtract.at(hist, joint, 2)
+    np.add.at(hist, joint - together.data, 2)
+    return hist
+
+
+# the expected number of types after k = 0, ..., nr_texts texts, and (with variance=True) its variance
+def expected_types(index, variance=True):
+    frequencies = text_frequencies(index)
+    seen = frequencies[frequencies > 0]                         # lemmas that do not occur in any text are left out
+    q = unseen_probability(index.nr_texts, 2 * index.nr_texts + 1)
+    d_hist = np.bincount(seen, minlength=index.nr_texts + 1)
+    q_lemmas = d_hist @ q[:index.nr_texts + 1]                  # sum of q(d_l, k)
+    mean = len(seen) - q_lemmas
+    if not variance:
+        return mean, None
+    q_squares = d_hist @ q[:index.nr_texts + 1] ** 2            # sum of q(d_l, k)^2
+    q_pairs = union_histogram(index, frequencies) @ q           # sum of q(u_lm, k) over the pairs l != m
+    var = q_lemmas - q_squares + q_pairs - (q_lemmas ** 2 - q_squares)
+    return mean, np.maximum(var, 0)
+
+
+# the expected curve (and its variance) at the token intervals xnew: k = xnew / (mean nr of tokens per text),
+# interpolated linearly between whole numbers of texts. This is an approximation: the simulations read the texts up to a
+# fixed number of tokens, not a fixed number of texts. The variance is the variance after k texts, which is larger than
+# the spread of the simulations at a fixed number of tokens (the varying length of the texts adds to it).
+def token_curve(index, xnew, variance=True):
+    mean, var = expected_types(index, variance)
+    freq = index.texts['Freq'].values
+    k = np.asarray(xnew) / freq.mean()
+    texts = np.arange(index.nr_texts + 1)
+    return np.interp(k, texts, mean), None if var is None else np.interp(k, texts, var)
+
+
+def save(path, xnew, mean, var):
+    np.savez(path, xnew=np.asarray(xnew), mean=mean, variance=np.full(len(mean), np.nan) if var is None else var)
+
+
+def load(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
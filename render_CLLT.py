@@ -0,0 +1,82 @@
+# Render all figures of the paper in one run
+# Instead of running plot_1_CLLT.py ... plot_5_CLLT.py one after the other (each of which reads its simulation results
+# again and computes the number of types per decade again), this script loads every data set once, computes the means and
+# the confidence bands once, and draws the five figures from them, in parallel worker processes where there are several cores.
+# The confidence bands are rasterized (see figures.py), so vector output (pdf, svg) stays small; each output target has its
+# own format and resolution (parameter targets), e.g. png at 300 dpi for the screen and pdf for print.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import spearmanr
+from timeit import default_timer as timer
+
+import figures
+import inference
+import metrics
+
+# Timer
+start =  timer()
+
+# set parameters
+decs_saily = range(1800,1900,10)  # decades of the Säily figures
+decs_pneo = range(1800,1910,10)   # decades of the Pneo figures
+xnew = np.arange(0, 15000000, 100000) # intervals (in running words) of the Säily simulations
+analytic_mean = False      # if True, the mean line of figures 1 and 2 is the analytic expected curve (if it has been computed; an approximation, see rarefaction.token_curve)
+workers = None             # nr of worker processes (None: one per core, at most one per figure)
+nr_resamples = 20000       # nr of permutations, bootstrap resamples and Monte Carlo draws for the inference on rho (see plot_3_CLLT.py)
+# the output targets: file extension -> dpi (png: raster image; pdf, svg: vector output, with the bands rasterized at dpi)
+targets = {'png': 300, 'pdf': 300}
+# the output files of the figures (without extension): figure number -> file name
+names = {1: 'plots/säily_plot_isch', 2: 'plots/säily_plot_nis', 3: 'plots/säily_plot_3_mean_V',
+         4: 'plots/plot_4_pneo_nis_isch', 5: 'plots/plot_5_pneo_tum'}
+
+
+# draw a figure and save it for all targets (in a worker process)
+def render(name, function, args, kwargs):
+    with metrics.timed('draw'):
+        fig = function(*args, **kwargs)
+    with metrics.timed('write'):
+        figures.save(fig, {'%s.%s' % (name, extension): dpi for extension, dpi in targets.items()})
+    return name, metrics.collect()
+
+
+run_metrics = metrics.RunMetrics('render', params = {'targets': targets, 'workers': workers})
+
+# load every data set once (the summaries written by the simulation scripts, see summary.py): the Säily simulations of
+# -isch and -nis are used by figures 1, 2 and 3
+run_metrics.stage('load')
+saily = {name: figures.saily_data(name, decs_saily, xnew, analytic_mean) for name in ('isch', 'nis')}
+pneo = {name: figures.pneo_data("data/%s_pneo_global_100.csv" % name.upper(), decs_pneo) for name in ('isch', 'nis', 'tum')}
+distances = {name: figures.distance_table(data) for name, data in saily.items()}
+for name, table in distances.items():
+    print("spearman's rho for -%s" % name, spearmanr(table["mean_diff"], table["running_words_cumulative"]))
+    result = inference.spearman_inference(table["running_words_cumulative"], table["mean_diff"], saily[name].get('cov_dec'),
+                                          saily[name]['nr_sim'], nr_resamples)
+    print("resampling inference for -%s:" % name, inference.format_result(result))
+
+jobs = [(names[1], figures.saily_figure, (saily['isch'], xnew), {'ylim': (0,2000)}),
+        (names[2], figures.saily_figure, (saily['nis'], xnew), {'ylim': (0,80)}),
+        (names[3], figures.distance_figure, ([('-isch', distances['isch'], (-350,200)), ('-nis', distances['nis'], (-13,4))],
+                                             decs_saily), {}),
+        (names[4], figures.pneo_figure, ([('-isch', pneo['isch'], (0,0.2), 4), ('-nis', pneo['nis'], (0,0.2), 1)], decs_pneo),
+         {'figsize': (6,6)}),
+        (names[5], figures.pneo_figure, ([('Pneo -tum', pneo['tum'], (0,0.5), 4)], decs_pneo), {'figsize': (6,3)})]
+
+# draw and save the figures; the workers are forked, so they share the loaded data with this process
+run_metrics.stage('render')
+workers = min(os.cpu_count() if workers is None else workers, len(jobs))
+if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+    rendered = [render(*job) for job in jobs]
+else:
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        rendered = list(pool.map(render, *zip(*jobs)))
+for name, times in rendered:
+    metrics.add(times)
+    print("saved", ", ".join('%s.%s' % (name, extension) for extension in targets))
+run_metrics.finish()
+
+end = timer()
+print("time elapsed: ", end - start)
@@ -0,0 +1,59 @@
+# Binary format for simulation results
+# Instead of a CSV file with text-formatted numbers, the simulation scripts write a compact binary file:
+#   8 bytes   magic 'CLLTSIM1'
+#   8 bytes   length of the header (little-endian unsigned integer)
+#   header    JSON: dtype, shape, column names and the metadata of the run (parameters, seed)
+#   data      the result table in column-major order (one column after the other), starting at a multiple of 64 bytes
+# Type counts are stored as int32, Pneo values as float32. The data are memory-mapped when the file is read, and
+# because every column is stored contiguously, reading a few columns only touches these parts of the file.
+
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'CLLTSIM1'
+ALIGN = 64
+
+
+# write a result table (one row per simulation) with the given column names, dtype and metadata
+def write_results(path, values, columns, dtype, meta=None):
+    values = np.asarray(values)
+    header = json.dumps({'dtype': np.dtype(dtype).str, 'shape': list(values.shape),
+                         'columns': [str(column) for column in columns], 'meta': meta or {}}).encode('utf-8')
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * (start - f.tell()))
+        f.write(np.asfortranarray(values, dtype=dtype).tobytes(order='F'))
+
+
+class SimResults:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a simulation result file" % path)
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length).decode('utf-8'))
+        start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+        self.path = path
+        self.meta = header['meta']
+        self.columns = header['columns']
+        self.shape = tuple(header['shape'])
+        self.data = np.memmap(path, dtype=header['dtype'], mode='r', offset=start, shape=self.shape, order='F')
+
+    # the values of one column (a read-only view into the file)
+    def column(self, name):
+        return self.data[:, self.columns.index(str(name))]
+
+    # a data frame with the selected columns (all columns if columns is None)
+    def to_frame(self, columns=None):
+        columns = self.columns if columns is None else [str(column) for column in columns]
+        return pd.DataFrame({name: self.column(name) for name in columns}, columns=columns)
+
+
+def read_results(path):
+    return SimResults(path)
@@ -0,0 +1,333 @@
+# Multi-core runner for the Säily and Pneo simulations
+# Every simulation n gets its own random stream, derived from the seed of the run (seed sequence with spawn key n).
+# Chunks of simulations are distributed over a pool of worker processes; the corpus index is copied into shared memory
+# once, and the workers read it from there without copying it. Because the random numbers of a simulation only depend on
+# the seed of the run and on n, the results are bit-identical whatever the number of workers or the chunk size,
+# and any single simulation can be regenerated from the seed.
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+import bands
+import metrics
+import pneo_engine
+import saily_engine
+
+
+# the Säily simulation: each simulation is a random permutation of the texts (given by sorting random keys),
+# its result is the number of types at the token intervals xnew
+class SailyModel:
+    def __init__(self, index, xnew):
+        self.index = index
+        self.xnew = np.asarray(xnew)
+
+    def nr_keys(self):
+        return self.index.nr_texts
+
+    def evaluate(self, keys):
+        with metrics.timed('shuffle'):
+            perms = np.argsort(keys, axis=1)
+        with metrics.timed('interpolate'):
+            grid = saily_engine.token_grid(self.index.freq, perms, self.xnew)
+        with metrics.timed('union'):
+            return saily_engine.grid_types(self.index, grid)
+
+
+# the Pneo simulation: each simulation is a re-sampled sub-corpus (the random keys shuffle the texts of the oversized decades),
+# its result is the Pneo value for each decade of interest
+# (the part of the sub-corpora that is the same in every simulation is evaluated once, see pneo_engine.FixedPart)
+class PneoModel:
+    def __init__(self, index, resampler, decs_result):
+        self.index = index
+        self.resampler = resampler
+        self.decs_result = np.asarray(decs_result)
+        self.fixed = pneo_engine.FixedPart(index, resampler)
+
+    def nr_keys(self):
+        return len(self.resampler.rows)
+
+    def evaluate(self, keys):
+        with metrics.timed('resample'):
+            masks = self.resampler.draw(None, keys=keys)
+        with metrics.timed('pivot'):
+            return pneo_engine.pneo(self.index, masks, self.decs_result, self.fixed)
+
+
+# several patterns evaluated on the same random permutations of the same texts (one SailyIndex per pattern): each permutation
+# is drawn once, and the simulations of the patterns are paired. The result has one block of len(xnew) columns per pattern
+class PairedSailyModel:
+    def __init__(self, indexes, xnew):
+        if any(not np.array_equal(index.freq, indexes[0].freq) for index in indexes):
+            raise ValueError("paired simulations need indexes built from the same list of texts")
+        self.indexes = list(indexes)
+        self.xnew = np.asarray(xnew)
+
+    def nr_keys(self):
+        return self.indexes[0].nr_texts
+
+    def evaluate(self, keys):
+        with metrics.timed('shuffle'):
+            perms = np.argsort(keys, axis=1)
+        with metrics.timed('interpolate'):
+            grid = saily_engine.token_grid(self.indexes[0].freq, perms, self.xnew)
+        with metrics.timed('union'):
+            return np.concatenate([saily_engine.grid_types(index, grid) for index in self.indexes], axis=1)
+
+
+# several patterns evaluated on the same re-sampled sub-corpora (one PneoIndex per pattern, all with the same files):
+# each sub-corpus is drawn once, and the simulations of the patterns are paired. The result has one block of
+# len(decs_result) columns per pattern
+class PairedPneoModel:
+    def __init__(self, indexes, resampler, decs_result):
+        if any(not np.array_equal(index.files, indexes[0].files) for index in indexes):
+            raise ValueError("paired simulations need indexes built from the same list of texts")
+        self.indexes = list(indexes)
+        self.resampler = resampler
+        self.decs_result = np.asarray(decs_result)
+        self.fixed = [pneo_engine.FixedPart(index, resampler) for index in self.indexes]
+
+    def nr_keys(self):
+        return len(self.resampler.rows)
+
+    def evaluate(self, keys):
+        with metrics.timed('resample'):
+            masks = self.resampler.draw(None, keys=keys)
+        with metrics.timed('pivot'):
+            return np.concatenate([pneo_engine.pneo(index, masks, self.decs_result, fixed)
+                                   for index, fixed in zip(self.indexes, self.fixed)], axis=1)
+
+
+# split the result of a paired model into the results of the single patterns
+def split_paired(result, nr_patterns):
+    return np.split(np.asarray(result), nr_patterns, axis=1)
+
+
+# the seed sequence of simulation n in the run with the given entropy
+def sim_seed(entropy, n):
+    return np.random.SeedSequence(entropy, spawn_key=(n,))
+
+
+# the random keys of the simulations first, ..., last-1: one row per simulation, each drawn from the simulation's own stream
+def simulation_keys(entropy, first, last, nr_keys):
+    keys = np.empty((last - first, nr_keys))
+    for row, n in enumerate(range(first, last)):
+        keys[row] = np.random.default_rng(sim_seed(entropy, n)).random(nr_keys)
+    return keys
+
+
+# run the simulations first, ..., last-1 of a model
+def run_chunk(model, entropy, first, last):
+    with metrics.timed('random'):
+        keys = simulation_keys(entropy, first, last, model.nr_keys())
+    return model.evaluate(keys)
+
+
+# regenerate the result of simulation n of a run
+def regenerate(model, entropy, n):
+    return run_chunk(model, entropy, n, n + 1)[0]
+
+
+# the following functions copy the numeric arrays of a model (and of the objects it consists of) into one block of
+# shared memory and rebuild the model in the workers from a layout that describes where each array is stored.
+# Other attributes (numbers, names) are small and are passed on with the layout.
+def _layout(obj, arrays):
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        arrays.append(np.ascontiguousarray(obj))
+        return ('array', len(arrays) - 1)
+    if sparse.issparse(obj):
+        obj = obj.tocsr()
+        return ('csr', obj.shape, _layout(obj.data, arrays), _layout(obj.indices, arrays), _layout(obj.indptr, arrays))
+    if type(obj).__module__ in (__name__, pneo_engine.__name__, saily_engine.__name__):
+        return ('object', type(obj), {name: _layout(value, arrays) for name, value in vars(obj).items()})
+    if isinstance(obj, list):
+        return ('list', [_layout(value, arrays) for value in obj])
+    return ('value', obj)
+
+
+def _rebuild(layout, arrays):
+    kind = layout[0]
+    if kind == 'array':
+        return arrays[layout[1]]
+    if kind == 'csr':
+        return sparse.csr_matrix(tuple(_rebuild(part, arrays) for part in layout[2:]), shape=layout[1])
+    if kind == 'object':
+        obj = layout[1].__new__(layout[1])
+        obj.__dict__.update({name: _rebuild(value, arrays) for name, value in layout[2].items()})
+        return obj
+    if kind == 'list':
+        return [_rebuild(value, arrays) for value in layout[1]]
+    return layout[1]
+
+
+def share(model):
+    arrays = []
+    layout = _layout(model, arrays)
+    specs, offset = [], 0
+    for array in arrays:
+        specs.append((offset, array.dtype.str, array.shape))
+        offset += -(-array.nbytes // 64) * 64  # keep every array aligned
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for array, (start, dtype, shape) in zip(arrays, specs):
+        np.ndarray(shape, dtype, buffer=block.buf, offset=start)[...] = array
+    return block, (layout, specs)
+
+
+def attach(name, description):
+    block = shared_memory.SharedMemory(name=name)
+    layout, specs = description
+    arrays = []
+    for start, dtype, shape in specs:
+        array = np.ndarray(shape, dtype, buffer=block.buf, offset=start)
+        array.flags.writeable = False
+        arrays.append(array)
+    return block, _rebuild(layout, arrays)
+
+
+# state of a worker process: the shared memory block and the model that reads from it
+_worker = {}
+
+
+def _init_worker(name, description):
+    _worker['block'], _worker['model'] = attach(name, description)
+
+
+# the result of a chunk, together with the times of the steps of the simulations in this worker (see metrics.timed)
+def _run_worker_chunk(entropy, first, last):
+    return run_chunk(_worker['model'], entropy, first, last), metrics.collect()
+
+
+# a fingerprint of the data of a model (all arrays and values it consists of), stored with checkpoints
+def fingerprint(model):
+    arrays = []
+    digest = hashlib.sha256(repr(_describe(_layout(model, arrays))).encode('utf-8'))
+    for array in arrays:
+        digest.update(array.dtype.str.encode('ascii') + repr(array.shape).encode('ascii'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _describe(layout):
+    if layout[0] == 'object':
+        return (layout[1].__name__, sorted((name, _describe(value)) for name, value in layout[2].items()))
+    if layout[0] == 'csr':
+        return ('csr', layout[1]) + tuple(_describe(part) for part in layout[2:])
+    if layout[0] == 'list':
+        return ('list', [_describe(value) for value in layout[1]])
+    if layout[0] == 'value' and isinstance(layout[1], np.ndarray):
+        return ('value', layout[1].tolist())
+    return layout
+
+
+# the chunks of a run: simulations first, ..., last-1
+def chunks(nr_sim, chunk_size, first=0):
+    return [(n, min(n + chunk_size, nr_sim)) for n in range(first, nr_sim, chunk_size)]
+
+
+# run nr_sim simulations of a model with the given number of worker processes and return the result matrix
+# (one row per simulation) together with the entropy of the run, which is needed to regenerate single simulations.
+# With a checkpoint store (checkpoint.CheckpointStore), every finished chunk is written to disk at once; the parameters
+# of the run (params, plus a fingerprint of the data) and its entropy are stored with them, and a run that is started
+# again resumes with the simulations that are still missing.
+# In aggregation mode (aggregate: an empty aggregate.StreamingBands), the results are not kept; every finished chunk is
+# added to the aggregate instead (or, with a checkpoint store, written to disk as a partial aggregate), and the aggregate
+# is returned in place of the result matrix.
+# The scripts are plain top-level scripts, so the workers are forked where possible: with 'spawn', every worker
+# would re-run the whole script.
+# Without a checkpoint store, first > 0 runs only the simulations first, ..., nr_sim-1 of the run (see run_adaptive).
+# progress(done, total) is called after every finished chunk (e.g. metrics.RunMetrics.progress).
+def run(model, nr_sim, seed=None, workers=None, chunk_size=256, store=None, params=None, aggregate=None, first=0,
+        progress=None):
+    workers = os.cpu_count() if workers is None else workers
+    if store is None:
+        entropy = np.random.SeedSequence(seed).entropy
+        parts = chunks(nr_sim, chunk_size, first)
+    else:
+        params = dict(params or {}, model=fingerprint(model))
+        if aggregate is not None:
+            params['aggregate'] = {'levels': list(aggregate.levels), 'capacity': aggregate.capacity}
+        entropy = store.open(params, seed)
+        parts = store.missing(nr_sim, chunk_size)
+
+    results = {}
+    total = sum(last - first for first, last in parts)
+    done = 0
+    if progress is not None and parts:
+        progress(done, total)
+
+    def finish(first, last, result):
+        nonlocal done
+        if aggregate is not None:
+            result = aggregate.empty_like().update(result)
+        if store is not None:
+            store.write(first, last, result)
+        elif aggregate is not None:
+            aggregate.merge(result)
+        else:
+            results[first] = result
+        done += last - first
+        if progress is not None:
+            progress(done, total)
+
+    if workers <= 1 or len(parts) <= 1:
+        for first, last in parts:
+            finish(first, last, run_chunk(model, entropy, first, last))
+    else:
+        block, description = share(model)
+        try:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                                     initializer=_init_worker, initargs=(block.name, description)) as pool:
+                futures = {pool.submit(_run_worker_chunk, entropy, first, last): (first, last) for first, last in parts}
+                for future in as_completed(futures):
+                    result, times = future.result()
+                    metrics.add(times)
+                    finish(*futures[future], result)
+        finally:
+            block.close()
+            block.unlink()
+
+    if store is not None and aggregate is not None:
+        return store.load_aggregate(aggregate, nr_sim), entropy
+    if store is not None:
+        return store.load(nr_sim), entropy
+    if aggregate is not None:
+        return aggregate, entropy
+    return np.concatenate([results[first] for first in sorted(results)]), entropy
+
+
+# adaptive mode: run the simulations in batches of batch_size until the Monte Carlo standard errors of the mean and of the
+# boundaries of the levels (bands.mc_errors) are at most tolerance at every grid point, or until max_sim simulations
+# have been run. Returns the results of all simulations (their number is the number that was needed), the entropy
+# of the run and the standard errors after the last batch.
+def run_adaptive(model, tolerance, batch_size=1000, max_sim=100000, levels=(0.98, 0.9), seed=None, workers=None,
+                 chunk_size=256, store=None, params=None, progress=None):
+    if max_sim < 1 or batch_size < 1:
+        raise ValueError("adaptive mode needs at least one simulation per batch and in total (batch_size %d, max_sim %d)"
+                         % (batch_size, max_sim))
+    results = []
+    nr_sim = 0
+    while nr_sim < max_sim:
+        last = min(nr_sim + batch_size, max_sim)
+        if store is None:
+            batch, seed = run(model, last, seed=seed, workers=workers, chunk_size=chunk_size, first=nr_sim,
+                              progress=progress)
+            results.append(batch)
+        else:
+            # the store already holds the earlier batches; it returns all simulations so far
+            batch, seed = run(model, last, seed=seed, workers=workers, chunk_size=chunk_size, store=store, params=params,
+                              progress=progress)
+            results = [batch]
+        nr_sim = last
+        errors = bands.mc_errors(np.concatenate(results), levels)
+        print("%d simulations: largest standard error %g (tolerance %g)" % (nr_sim, bands.max_error(errors), tolerance))
+        if bands.max_error(errors) <= tolerance:
+            break
+    else:
+        print("the tolerance was not reached with the maximum of %d simulations" % max_sim)
+    return np.concatenate(results), seed, errors
@@ -0,0 +1,128 @@
+# Vectorized engine for the Säily simulations (säily_isch_CLLT.py, säily_nis_CLLT.py)
+# Instead of walking through every shuffled corpus text by text and growing a Python set of types,
+# the texts and lemmas are coded as integers once. For every permutation of the texts we only need to know
+# at which position each lemma is seen for the first time: the number of types after m texts is then simply
+# the number of lemmas whose first position is smaller than m, i.e. a cumulative count over these positions.
+# Whole batches of permutations are processed as NumPy arrays.
+
+import numpy as np
+
+
+# the text x lemma incidence structure.
+# freq holds the token count of each text, pair_text / pair_lemma hold one entry for each (text, lemma) combination
+# that occurs in the corpus. The pairs are sorted by lemma, so that lemma_starts marks the first pair of each lemma.
+class SailyIndex:
+    def __init__(self, freq, pair_text, pair_lemma, lemmas):
+        order = np.lexsort((pair_text, pair_lemma))
+        self.freq = np.asarray(freq, dtype=np.int64)
+        self.pair_text = np.asarray(pair_text, dtype=np.int64)[order]
+        self.pair_lemma = np.asarray(pair_lemma, dtype=np.int64)[order]
+        self.lemmas = np.asarray(lemmas, dtype=object)
+        self.nr_texts = len(self.freq)
+        self.nr_lemmas = len(self.lemmas)
+        self.lemma_starts = np.searchsorted(self.pair_lemma, np.arange(self.nr_lemmas))
+
+
+# draw a batch of random permutations of the texts (one row per simulation)
+def permutations(rng, nr_perm, nr_texts):
+    return np.argsort(rng.random((nr_perm, nr_texts)), axis=1)
+
+
+# the following function takes a batch of permutations (one row per simulation, each row lists the text ids in reading order)
+# and returns, for each simulation and each lemma, the position of the first text in which the lemma occurs
+def first_occurrence(index, perms):
+    perms = np.atleast_2d(perms)
+    nr_perm = perms.shape[0]
+    position = np.empty(perms.shape, dtype=np.int32)  # position[n, text] = position of the text in permutation n
+    position[np.arange(nr_perm)[:, None], perms] = np.arange(index.nr_texts, dtype=np.int32)
+    return np.minimum.reduceat(position[:, index.pair_text], index.lemma_starts, axis=1)
+
+
+# the following function returns the type and token curves for a batch of permutations.
+# Both arrays have one row per simulation and nr_texts+1 columns; column m holds the values after reading m texts
+# (this is exactly the layout of result_types and result_tokens_total in the Säily scripts)
+def type_curves(index, perms):
+    perms = np.atleast_2d(perms)
+    nr_perm, nr_texts = perms.shape
+    first = first_occurrence(index, perms)
+
+    # count the number of lemmas that are new at each position, then add them up
+    offsets = (np.arange(nr_perm, dtype=np.int64) * nr_texts)[:, None]
+    new_types = np.bincount((first + offsets).ravel(), minlength=nr_perm * nr_texts).reshape(nr_perm, nr_texts)
+
+    types = np.zeros((nr_perm, nr_texts + 1), dtype=np.int64)
+    tokens = np.zeros((nr_perm, nr_texts + 1), dtype=np.int64)
+    np.cumsum(new_types, axis=1, out=types[:, 1:])
+    np.cumsum(index.freq[perms], axis=1, out=tokens[:, 1:])
+    return types, tokens
+
+
+# run nr_sim simulations in batches of batch_size permutations and return the two result matrices
+def simulate(index, nr_sim, rng=None, batch_size=64):
+    rng = np.random.default_rng() if rng is None else rng
+    result_types = np.empty([nr_sim, index.nr_texts + 1], dtype=np.int64)
+    result_tokens_total = np.empty([nr_sim, index.nr_texts + 1], dtype=np.int64)
+    for start in range(0, nr_sim, batch_size):
+        stop = min(start + batch_size, nr_sim)
+        perms = permutations(rng, stop - start, index.nr_texts)
+        result_types[start:stop], result_tokens_total[start:stop] = type_curves(index, perms)
+    return result_types, result_tokens_total
+
+
+# the following function projects the type curves of a batch of permutations directly onto the token grid xnew
+# (linear interpolation between the texts, as with interp1d in the Säily scripts), without building the per-text type curves.
+# Only the token counts of the batch are accumulated; the number of types after m texts is looked up in the sorted
+# first-occurrence positions. The result has one row per simulation and one column per grid point.
+def grid_curves(index, perms, xnew):
+    return grid_types(index, token_grid(index.freq, perms, xnew))
+
+
+# the part of grid_curves that depends only on the texts (the token counts), not on the types: for each permutation and
+# grid point, the nr of texts lo after which the grid point lies and the token counts after lo and lo+1 texts.
+# Indexes of different patterns built from the same texts can share it.
+def token_grid(freq, perms, xnew):
+    perms = np.atleast_2d(perms)
+    nr_perm, nr_texts = perms.shape
+    xnew = np.asarray(xnew)
+    total = int(freq.sum())
+    if xnew.min() < 0 or xnew.max() > total:
+        raise ValueError("A value in xnew is outside the interpolation range (0 - %d tokens)." % total)
+
+    tokens = np.zeros((nr_perm, nr_texts + 1), dtype=np.int64)
+    np.cumsum(freq[perms], axis=1, out=tokens[:, 1:])
+
+    # searchsorted for all rows at once: each row is shifted by a multiple of (total + 1), so the rows do not overlap
+    rows = np.arange(nr_perm, dtype=np.int64)[:, None]
+    shift = rows * (total + 1)
+    lo = np.searchsorted((tokens + shift).ravel(), (xnew[None, :] + shift).ravel(), side='right').reshape(nr_perm, -1)
+    lo = np.clip(lo - rows * (nr_texts + 1) - 1, 0, nr_texts - 1)
+    return perms, xnew, lo, np.take_along_axis(tokens, lo, axis=1), np.take_along_axis(tokens, lo + 1, axis=1)
+
+
+# the number of types of one pattern at the grid points of a token grid (see token_grid)
+def grid_types(index, grid):
+    perms, xnew, lo, x_lo, x_hi = grid
+    nr_perm, nr_texts = perms.shape
+    rows = np.arange(nr_perm, dtype=np.int64)[:, None]
+
+    # the number of types after m texts is the number of lemmas whose first position is smaller than m
+    first = np.sort(first_occurrence(index, perms), axis=1).astype(np.int64)
+    shift = rows * (nr_texts + 1)
+    def nr_types(m):
+        found = np.searchsorted((first + shift).ravel(), (m + shift).ravel(), side='left').reshape(nr_perm, -1)
+        return found - rows * index.nr_lemmas
+
+    y_lo = nr_types(lo).astype(float)
+    y_hi = nr_types(lo + 1).astype(float)
+    slope = (y_hi - y_lo) / (x_hi - x_lo)
+    return (slope * (xnew[None, :] - x_lo) + y_lo).astype(np.int64)
+
+
+# run nr_sim simulations in batches and return only the nr_sim x len(xnew) matrix of types on the token grid
+def simulate_grid(index, nr_sim, xnew, rng=None, batch_size=64):
+    rng = np.random.default_rng() if rng is None else rng
+    result = np.empty([nr_sim, len(xnew)], dtype=np.int64)
+    for start in range(0, nr_sim, batch_size):
+        stop = min(start + batch_size, nr_sim)
+        result[start:stop] = grid_curves(index, permutations(rng, stop - start, index.nr_texts), xnew)
+    return result
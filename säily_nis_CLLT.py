@@ -16,75 +16,142 @@ import re
 from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
 from timeit import default_timer as timer
+import saily_engine
+import text_index
+import rarefaction
+import ingest
+import runner
+import checkpoint
+import aggregate
+import results_io
+import metrics
+import summary
 
 # Timer
 start =  timer()
 
+# the stages of the run are timed, and the metrics are written to data/metrics (see metrics.py)
+run_metrics = metrics.RunMetrics('nis_saily')
+run_metrics.stage('load')
+
 # Load list of files
+# the lists of occurrences are read in chunks with ingest.py (from the zip archive if there is no csv file) and counted chunk by chunk
+# (text_index.OccurrenceCounts), so that only the counts of the distinct combinations of text, decade and lemma are kept;
+# the counts are cached, and later runs load them until the list changes
 texts_dta  = pd.read_csv('data/dta_texts_18c.csv', sep= ',') # this file includes the filename, the decade the text was printed, and the total tokens
-nis_raw  = pd.read_csv('data/nis_18c.csv', sep = ";")            # this file includes a line for each pertinent -nis-token in the DTA corpus
+nis_counts  = ingest.read_counts('data/nis_18c.csv', texts_dta, sep = ";") # this file includes a line for each pertinent -nis-token in the DTA corpus
 
 nr_texts = len(texts_dta)  # extract the number of different texts in the corpus
 
-# establish a list of a list of lemmas per text
-# initialize variable
-types_texts = []
-
-# for each text:
-for index, row in texts_dta.iterrows():
-    types_texts.append(set(nis_raw.loc[nis_raw['Datei'] == row['Datei'],'Lemma'])) # extract the different -nis types in the text
-texts_dta['Types'] = types_texts  # write the list of different -nis types into the dataframe
-
-texts_dta.to_csv("data/nis_texts_dta.csv", encoding = "utf-8")   # save the dataframe
+run_metrics.stage('index')
+# establish the lemmas per text: the counted occurrences (files, lemmas and the number of occurrences of each lemma
+# in each file) are turned into an index of the texts with their different -nis types
+texts_index = text_index.TextIndex.from_counts(texts_dta, nis_counts)
+texts_index.save("data/nis_texts_index.npz")
 
 # set parameters
 nr_sim = 100            # nr of simulations
 decs = range(1800,1890,10) # the decades of interest
-
-# initialize lists
-result_types = np.empty([nr_sim, nr_texts+1], dtype= int)
-result_tokens_total = np.empty([nr_sim, nr_texts+1], dtype= int)
-
-# the first element in both lists is set to 0: the number of types at a corpus size of 0 tokens is, well, 0.
-result_types[:,0] = 0
-result_tokens_total[:,0] = 0
-
-# this is where the actual computations happen.
-# for each simulation:
-for n in range(nr_sim):
-    print("Nr. simulation: ", n)
-    subcorpus = texts_dta.sample(frac = 1)    #shuffle the corpus
-    types = set()                             #initialize local list of types
-    tokens_total = 0                          #initialize local token count
-    for m in range(nr_texts):                 # now read in the corpus, text by text. for each text in the corpus:
-        tokens_total = tokens_total + subcorpus.iloc[m,0]   # add the token count of the text in question to the total token count
-        types = types | subcorpus.iloc[m,3]                 # union of the set of types already there and the set of types in the new text
-        result_tokens_total[n,m+1] = tokens_total           # hand over the token count to the global variable
-        result_types[n,m+1] = len(types)                    # and do the same for the number of (distinct) types
-
-result_types = pd.DataFrame(result_types)                   # turn ndarrays into dataframes
-result_tokens_total = pd.DataFrame(result_tokens_total)
-
-# we now have information about the corpus size and the number of types after each step of the sampling process.
-# Yet the steps are not uniform: Sometimes the first text sampled is 100.000 tokens long, sometimes only 1.000.
-# That means we have to interpolate the data. This is done in the following section.
-
-# Determine intervals at which the number of types are interpolated
-xnew = np.arange(0, 15000000, 100000)
-
-# Initialize global variable
-result_types_over_tokens_total = np.empty([result_types.shape[0], len(xnew)], dtype= int)
-
-# and again, for each of these results
-for p in range(result_types.shape[0]):
-    print(p)
-    y = result_types.iloc[p,:].values          # the y-values to interpolate from (the types)
-    xt = result_tokens_total.iloc[p,:].values  # the x-values (the tokens)
-    f = interp1d(xt, y)                        # linear interpolation function
-    result_types_over_tokens_total[p,:] = f(xnew) # now compute the type values for the xnew intervals
-
-result_types_over_tokens_total = pd.DataFrame(result_types_over_tokens_total)
-result_types_over_tokens_total.to_csv("data/nis_types_over_tokens_total.csv", encoding = "utf-8")
+xnew = np.arange(0, 15000000, 100000) # intervals (in running words) at which the number of types is determined
+fused = True            # if True, project each batch of simulations directly onto xnew (no per-text curves are kept)
+workers = None          # nr of worker processes for the fused simulations (None: one per core)
+seed = None             # seed of the random streams (None: a fresh seed is drawn and printed)
+aggregate_only = False  # if True (fused mode only), keep only the means and the 90%/98% boundaries instead of every simulation
+export_csv = False      # if True, the results are also written as a csv file (in addition to the binary file)
+adaptive = False        # if True (fused mode only), run batches of simulations until the standard errors of the means and boundaries are below tolerance (nr_sim is the maximum)
+tolerance = 5           # the largest accepted Monte Carlo standard error in types (adaptive mode)
+adaptive_batch = 1000   # nr of simulations per batch (adaptive mode)
+analytic = True         # if True, the expected type curve and its variance are also computed analytically (rarefaction.py)
+checkpoint_dir = None      # a directory (e.g. 'data/nis_saily_checkpoint'): finished chunks are stored there, and an interrupted run resumes from them; it is removed when the run is complete (None: no checkpoints)
+
+if adaptive and (aggregate_only or not fused):
+    raise ValueError("adaptive mode needs every simulation and is only available in fused mode without aggregate_only")
+
+run_metrics.params = {'nr_sim': nr_sim, 'fused': fused, 'workers': workers, 'aggregate_only': aggregate_only,
+                      'adaptive': adaptive, 'analytic': analytic}
+
+# the texts and their types are turned into an integer-coded index once; for each simulation (in batches of shuffled corpora),
+# the engine determines the position at which each lemma occurs first and counts the types and tokens after each text.
+index = texts_index.saily_index()
+
+if analytic:
+    run_metrics.stage('analytic')
+    # the expected number of types at the xnew intervals, computed from the text frequencies of the lemmas (no simulations needed)
+    expected_types, expected_variance = rarefaction.token_curve(texts_index, xnew)
+    rarefaction.save("data/nis_expected_types.npz", xnew, expected_types, expected_variance)
+
+run_metrics.stage('simulate')
+if fused:
+    # this is where the actual computations happen: the engine interpolates the number of types at the xnew intervals
+    # batch by batch, so only the final table with one row per simulation and one column per interval is kept in memory.
+    # the simulations are distributed in chunks over the worker processes; each simulation shuffles the corpus with its own
+    # random stream (derived from the seed), so the results do not depend on the number of workers.
+    model = runner.SailyModel(index, xnew)
+    store = checkpoint.CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+    if aggregate_only:
+        # only the running means, variances and the values needed for the boundaries are kept (see aggregate.py)
+        bands, entropy = runner.run(model, nr_sim, seed = seed, workers = workers, store = store, params = {'pattern': 'nis'},
+                                    progress = run_metrics.progress,
+                                    aggregate = aggregate.StreamingBands(len(xnew), levels = (0.9, 0.98), capacity = nr_sim))
+    elif adaptive:
+        # the standard errors are checked after every batch (see bands.mc_errors); nr_sim becomes the number that was needed
+        result_types_over_tokens_total, entropy, errors = runner.run_adaptive(model, tolerance, batch_size = adaptive_batch,
+                                                                              max_sim = nr_sim, seed = seed, workers = workers,
+                                                                              store = store, params = {'pattern': 'nis'},
+                                                                              progress = run_metrics.progress)
+        nr_sim = len(result_types_over_tokens_total)
+        print("simulations needed: ", nr_sim)
+    else:
+        result_types_over_tokens_total, entropy = runner.run(model, nr_sim, seed = seed, workers = workers,
+                                                             store = store, params = {'pattern': 'nis'},
+                                                             progress = run_metrics.progress)
+else:
+    # this is where the actual computations happen.
+    # result_types and result_tokens_total have one row per simulation; the first element in each row is 0:
+    # the number of types at a corpus size of 0 tokens is, well, 0.
+    entropy = np.random.SeedSequence(seed).entropy
+    result_types, result_tokens_total = saily_engine.simulate(index, nr_sim, np.random.default_rng(entropy))
+
+    result_types = pd.DataFrame(result_types)                   # turn ndarrays into dataframes
+    result_tokens_total = pd.DataFrame(result_tokens_total)
+
+    # we now have information about the corpus size and the number of types after each step of the sampling process.
+    # Yet the steps are not uniform: Sometimes the first text sampled is 100.000 tokens long, sometimes only 1.000.
+    # That means we have to interpolate the data. This is done in the following section.
+
+    run_metrics.stage('interpolate')
+    # Initialize global variable
+    result_types_over_tokens_total = np.empty([result_types.shape[0], len(xnew)], dtype= int)
+
+    # and again, for each of these results
+    for p in range(result_types.shape[0]):
+        run_metrics.progress(p + 1, result_types.shape[0])
+        y = result_types.iloc[p,:].values          # the y-values to interpolate from (the types)
+        xt = result_tokens_total.iloc[p,:].values  # the x-values (the tokens)
+        f = interp1d(xt, y)                        # linear interpolation function
+        result_types_over_tokens_total[p,:] = f(xnew) # now compute the type values for the xnew intervals
+
+print("seed: ", entropy)   # in fused mode, any single simulation n can be regenerated with runner.regenerate(model, entropy, n)
+
+run_metrics.stage('write')
+# the summary for the plot scripts (see summary.py): the means and the boundaries, and the actual and the mean number of
+# types in each decade
+summary.write_saily(summary.summary_path("data/nis_types_over_tokens_total.csv"),
+                    bands if fused and aggregate_only else result_types_over_tokens_total, xnew, texts_index,
+                    expected = expected_types if analytic else None)
+if fused and aggregate_only:
+    bands.save("data/nis_types_over_tokens_total_bands.npz")
+else:
+    # save the results in the binary format (type counts as int32), together with the parameters and the seed of the run
+    results_io.write_results("data/nis_types_over_tokens_total.bin", result_types_over_tokens_total, range(len(xnew)), np.int32,
+                             meta = {'pattern': 'nis', 'nr_sim': nr_sim, 'xnew': xnew.tolist(), 'fused': fused, 'seed': str(entropy)})
+    if export_csv:
+        result_types_over_tokens_total = pd.DataFrame(result_types_over_tokens_total)
+        result_types_over_tokens_total.to_csv("data/nis_types_over_tokens_total.csv", encoding = "utf-8")
+# the run is complete: its checkpoint is removed, so that the next run starts anew (with a fresh seed if seed is None)
+if fused and store is not None:
+    store.clear()
+run_metrics.finish()
 
 end = timer()
 print("time elapsed: ", end - start)
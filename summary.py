@@ -0,0 +1,87 @@
+# Plot summaries: small files with everything the plot scripts need, written by the simulation scripts
+# A summary holds the mean of the simulations and the lower and upper boundaries of each level at every grid point (token
+# interval or decade). For the Säily simulations, it also holds the actual number of running words and types in each
+# decade, the cumulative number of running words, the mean of the simulations at the size of each decade and the difference
+# between the actual and the mean number of types (plot 3) with the covariance of the simulations at the sizes of the
+# decades (for the uncertainty of the mean, see inference.py), and the analytic expected curve if it has been computed.
+# The file is written next to the results (e.g. data/isch_types_over_tokens_total_summary.npz) and is a few kilobytes, so
+# the plot scripts load it in milliseconds instead of reading all simulations and the index of the texts.
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
+
+import aggregate
+import bands
+
+LEVELS = (0.98, 0.9)
+
+
+# the name of the summary of a result file (given, as in bands.load, by the name of the csv file)
+def summary_path(path):
+    return os.path.splitext(path)[0] + '_summary.npz'
+
+
+def _bands(sims, levels):
+    if not isinstance(sims, aggregate.StreamingBands):
+        sims = np.asarray(sims)
+    conf_bands = bands.conf_bands(sims, levels)
+    return {'mean': bands.mean(sims), 'levels': np.asarray(levels),
+            'lower': np.array([conf_bands[conf][0] for conf in levels]),
+            'upper': np.array([conf_bands[conf][1] for conf in levels])}
+
+
+def _nr_sim(sims):
+    return sims.count.max() if isinstance(sims, aggregate.StreamingBands) else len(sims)
+
+
+# the covariance of the simulated numbers of types at the sizes of the decades (tokens_dec); the simulations are interpolated
+# linearly between the points of xnew. An aggregate.StreamingBands only keeps the variance at each point, so only the
+# variances are known (the diagonal; the standard deviations are interpolated like the values)
+def decade_cov(sims, xnew, tokens_dec):
+    weights = interp1d(xnew, np.eye(len(xnew)), axis=0)(tokens_dec)
+    if isinstance(sims, aggregate.StreamingBands):
+        return np.diag((weights @ np.sqrt(np.nan_to_num(sims.variance()))) ** 2)
+    return np.atleast_2d(np.cov(sims @ weights.T, rowvar=False))
+
+
+# the summary of the Säily simulations of a pattern. sims: one row per simulation (or an aggregate.StreamingBands);
+# texts_index: the text_index.TextIndex of the pattern; decs: the decades (None: all decades of the texts);
+# expected: the analytic expected curve at xnew (or None)
+def saily_summary(sims, xnew, texts_index, decs=None, levels=LEVELS, expected=None):
+    if not isinstance(sims, aggregate.StreamingBands):
+        sims = np.maximum(np.asarray(sims), 0)
+    decs = list(texts_index.decade_tokens().index if decs is None else decs)
+    summary = _bands(sims, levels)
+    tokens_dec = texts_index.decade_tokens()['Freq'].reindex(decs, fill_value=0).values
+    types_dec = texts_index.decade_types(decs)
+    mean_dec = interp1d(xnew, summary['mean'])(tokens_dec)
+    return dict(summary, grid=np.asarray(xnew), nr_sim=_nr_sim(sims), decs=np.asarray(decs), tokens_dec=tokens_dec,
+                types_dec=types_dec, running_words_cumulative=pd.Series(tokens_dec).rolling(10, 1).sum().values,
+                mean_dec=mean_dec, mean_diff=types_dec - mean_dec, cov_dec=decade_cov(sims, xnew, tokens_dec),
+                expected=np.full(len(xnew), np.nan) if expected is None else np.asarray(expected))
+
+
+# the summary of the Pneo simulations of a pattern: the mean and the boundaries for each decade of interest
+def pneo_summary(sims, decs_result, levels=LEVELS):
+    return dict(_bands(sims, levels), grid=np.asarray(decs_result), nr_sim=_nr_sim(sims))
+
+
+def write_saily(path, sims, xnew, texts_index, decs=None, levels=LEVELS, expected=None):
+    np.savez(path, **saily_summary(sims, xnew, texts_index, decs, levels, expected))
+
+
+def write_pneo(path, sims, decs_result, levels=LEVELS):
+    np.savez(path, **pneo_summary(sims, decs_result, levels))
+
+
+# the boundaries of a summary as in bands.conf_bands: a dictionary level -> (lower, upper)
+def conf_bands(summary):
+    return {conf: (summary['lower'][i], summary['upper'][i]) for i, conf in enumerate(summary['levels'].tolist())}
+
+
+def load(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
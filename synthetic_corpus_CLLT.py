@@ -0,0 +1,102 @@
+# Synthetic DTA-like corpora for scale testing
+# The script writes a list of texts and a list of occurrences of a (made-up) word formation pattern in the same format as
+# the shipped data, but scale times as large:
+#   texts_dta.csv       Datei,Dekade,Freq        all texts (as data/texts_dta.csv)
+#   dta_texts_18c.csv   Freq,Dekade,Datei        the texts of the decades subset_decs (as data/dta_texts_18c.csv)
+#   <pattern>.csv       Jahr;Dekade;Lemma;Datei  all occurrences (as data/isch.csv)
+#   <pattern>_18c.csv   Jahr;Dekade;Lemma;Datei  the occurrences in the decades subset_decs (as data/isch_18c.csv)
+# The number of texts per decade and the distribution of their lengths are taken from the template (data/texts_dta.csv):
+# each decade has scale times as many texts, whose lengths are drawn from the lengths of the texts of the same decade in
+# the template, multiplied by a log-normal factor (length_jitter), so that no two copies of a text are exactly alike. Each text contains a Poisson number of occurrences
+# (rate per running word), and the lemmas are drawn from a Zipf-Mandelbrot distribution over an unbounded vocabulary:
+# lemma r has the probability ~ (r + zipf_offset)^(-1/vocabulary_growth). The number of types then grows with the number
+# of occurrences n roughly like n^vocabulary_growth (Heaps' law), and zipf_offset flattens the head of the distribution.
+# The texts are generated and written block by block, so corpora of many gigabytes need no more memory than one block.
+
+import os
+import numpy as np
+import pandas as pd
+from timeit import default_timer as timer
+
+# Timer
+start =  timer()
+
+# set parameters
+scale = 10                 # the corpus is this many times as large as the template (in number of texts)
+template = 'data/texts_dta.csv' # the list of texts whose number of texts and lengths per decade are imitated
+pattern = 'synth'          # the name of the pattern (and the suffix of the lemmas)
+length_jitter = 0.2        # standard deviation of the log-normal factor on the length of the texts
+rate = 0.004               # occurrences of the pattern per running word (-isch in the DTA: about 0.004)
+vocabulary_growth = 0.45   # Heaps exponent: the number of types grows like (nr of occurrences)^vocabulary_growth
+zipf_offset = 20           # the larger, the flatter the frequencies of the most frequent lemmas
+subset_decs = range(1800,1900,10) # decades of the 18c files (the Säily simulations)
+block_size = 1000          # nr of texts generated and written at a time
+seed = 1                   # seed of the random numbers
+output_dir = 'data/synthetic_x%d' % scale # the files are written to this directory
+
+
+# the lengths of the texts in each decade of the template
+def decade_lengths(texts):
+    texts = texts[texts['Freq'] > 0]
+    return {decade: freq.values for decade, freq in texts.groupby('Dekade')['Freq']}
+
+
+# ranks 0, 1, 2, ... of lemmas drawn from the Zipf-Mandelbrot distribution (inverse transform of its continuous tail)
+def zipf_ranks(rng, size):
+    u = rng.random(size)
+    return np.floor(zipf_offset * (u ** (-vocabulary_growth / (1 - vocabulary_growth)) - 1)).astype(np.int64)
+
+
+# one block of texts and their occurrences
+def generate_block(rng, decade, nr_texts, first, lengths):
+    freq = rng.choice(lengths, nr_texts) * rng.lognormal(0, length_jitter, nr_texts)
+    freq = np.maximum(np.rint(freq), 1).astype(np.int64)
+    years = decade + rng.integers(0, 10, nr_texts)
+    names = np.char.add(np.char.add('synthetic_', np.char.zfill(np.arange(first, first + nr_texts).astype(str), 8)),
+                        np.char.add('_', years.astype(str)))
+    names = np.char.add(names, '.tcf.xml')
+    texts = pd.DataFrame({'Datei': names, 'Dekade': decade, 'Freq': freq})
+    nr_occurrences = rng.poisson(rate * freq)
+    text = np.repeat(np.arange(nr_texts), nr_occurrences)
+    lemmas = np.char.add(np.char.add('lemma', zipf_ranks(rng, len(text)).astype(str)), pattern)
+    occurrences = pd.DataFrame({'Jahr': years[text], 'Dekade': decade, 'Lemma': lemmas, 'Datei': names[text]})
+    return texts, occurrences
+
+
+if not 0 < vocabulary_growth < 1:
+    raise ValueError("vocabulary_growth must be between 0 and 1, not %s" % vocabulary_growth)
+rng = np.random.default_rng(seed)
+lengths = decade_lengths(pd.read_csv(template, sep = ','))
+os.makedirs(output_dir, exist_ok=True)
+files = {'texts': os.path.join(output_dir, 'texts_dta.csv'),
+         'texts_18c': os.path.join(output_dir, 'dta_texts_18c.csv'),
+         'occurrences': os.path.join(output_dir, pattern + '.csv'),
+         'occurrences_18c': os.path.join(output_dir, pattern + '_18c.csv')}
+out = {name: open(file, 'w', encoding='utf-8', newline='') for name, file in files.items()}
+try:
+    out['texts'].write('Datei,Dekade,Freq\n')
+    out['texts_18c'].write('Freq,Dekade,Datei\n')
+    out['occurrences'].write('Jahr;Dekade;Lemma;Datei\n')
+    out['occurrences_18c'].write('Jahr;Dekade;Lemma;Datei\n')
+    nr_texts, nr_tokens, nr_occurrences = 0, 0, 0
+    for decade, template_lengths in sorted(lengths.items()):
+        decade_texts = int(round(len(template_lengths) * scale))
+        for first in range(0, decade_texts, block_size):
+            texts, occurrences = generate_block(rng, decade, min(block_size, decade_texts - first), nr_texts, template_lengths)
+            texts.to_csv(out['texts'], header = False, index = False)
+            occurrences.to_csv(out['occurrences'], sep = ';', header = False, index = False)
+            if decade in subset_decs:
+                texts[['Freq', 'Dekade', 'Datei']].to_csv(out['texts_18c'], header = False, index = False)
+                occurrences.to_csv(out['occurrences_18c'], sep = ';', header = False, index = False)
+            nr_texts += len(texts)
+            nr_tokens += int(texts['Freq'].sum())
+            nr_occurrences += len(occurrences)
+        print("decade %d: %d texts, %d running words, %d occurrences so far" % (decade, nr_texts, nr_tokens, nr_occurrences))
+finally:
+    for f in out.values():
+        f.close()
+for file in files.values():
+    print("%s: %.1f MB" % (file, os.path.getsize(file) / 1e6))
+
+end = timer()
+print("time elapsed: ", end - start)
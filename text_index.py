@@ -0,0 +1,187 @@
+# Integer-coded text -> lemma index
+# For each text in the corpus (one row in texts_dta: Datei, Dekade, Freq), the index holds the distinct lemmas that
+# occur in it, in a compressed sparse row layout: the lemma ids of text t are lemma_ids[offsets[t]:offsets[t+1]],
+# and lemmas is the vocabulary (sorted), so that lemma id i stands for lemmas[i].
+# This replaces the per-text sets of types that the Säily scripts used to write as Python strings into *_texts_dta.csv;
+# the index is saved as an .npz file (e.g. data/isch_texts_index.npz) and can be loaded without eval.
+# OccurrenceCounts is the preprocessing step shared by the Säily and the Pneo simulations: the list of occurrences is coded
+# as integers and counted in one sort pass, instead of scanning the whole list once for every text. Long lists can be
+# counted chunk by chunk (OccurrenceCounts.from_chunks).
+
+import numpy as np
+import pandas as pd
+
+import saily_engine
+
+
+# the number of occurrences of each lemma in each file and decade.
+# files are the distinct files of the list of texts (texts_dta), decades and lemmas are sorted; entry i says that
+# lemma lemmas[occ_lemma[i]] occurs occ_count[i] times in file files[occ_file[i]] in decade decades[occ_dec[i]].
+# The entries are sorted by file, decade and lemma.
+class OccurrenceCounts:
+    def __init__(self, files, decades, lemmas, occ_file, occ_dec, occ_lemma, occ_count):
+        self.files = np.asarray(files, dtype=object)
+        self.decades = np.asarray(decades)
+        self.lemmas = np.asarray(lemmas, dtype=object)
+        self.occ_file = np.asarray(occ_file, dtype=np.int64)
+        self.occ_dec = np.asarray(occ_dec, dtype=np.int64)
+        self.occ_lemma = np.asarray(occ_lemma, dtype=np.int64)
+        self.occ_count = np.asarray(occ_count, dtype=np.int64)
+
+    # count the list of occurrences (Dekade, Lemma, Datei). occurrences in files that are not part of texts
+    # (texts_dta: Datei, Dekade, Freq) can never be sampled and are left out.
+    @classmethod
+    def from_frames(cls, texts, occurrences):
+        return cls.from_chunks(texts, [occurrences])
+
+    # count the list of occurrences chunk by chunk (chunks: data frames, e.g. from ingest.read_chunks). After each chunk,
+    # only the counts of the distinct combinations of file, decade and lemma are kept, so the memory needed grows with
+    # the number of these combinations and not with the number of occurrences.
+    @classmethod
+    def from_chunks(cls, texts, chunks):
+        files = pd.unique(texts['Datei'])
+        file_index = pd.Index(files)
+        if len(files) >= 1 << 22:
+            raise ValueError("too many texts (%d) for the packed keys" % len(files))
+        decades = pd.Index([])
+        lemmas = pd.Index([])
+        key = np.zeros(0, dtype=np.int64)
+        occ_count = np.zeros(0, dtype=np.int64)
+        for chunk in chunks:
+            occ_file = file_index.get_indexer(chunk['Datei'])
+            sampled = (occ_file >= 0) & chunk['Dekade'].notna().values & chunk['Lemma'].notna().values
+            dekade = np.asarray(chunk['Dekade'])[sampled]
+            lemma = np.asarray(chunk['Lemma'], dtype=object)[sampled]
+            # decades and lemmas get their codes in the order in which they are found; they are sorted at the end
+            decades = decades.append(pd.Index(pd.unique(dekade)).difference(decades))
+            lemmas = lemmas.append(pd.Index(pd.unique(lemma)).difference(lemmas))
+
+            # merge the counts of the chunk into the counts so far
+            chunk_key = _pack(occ_file[sampled], decades.get_indexer(dekade), lemmas.get_indexer(lemma))
+            key, inverse = np.unique(np.concatenate((key, chunk_key)), return_inverse=True)
+            occ_count = np.bincount(inverse.ravel(), minlength=len(key),
+                                    weights=np.concatenate((occ_count, np.ones(len(chunk_key), dtype=np.int64)))).astype(np.int64)
+
+        # sort the decades and lemmas, and the entries by file, decade and lemma
+        decades = pd.Index(decades.tolist())
+        occ_file, occ_dec, occ_lemma = _unpack(key)
+        dec_order = np.argsort(decades.values, kind='stable')
+        lemma_order = np.argsort(lemmas.values.astype(str), kind='stable')
+        dec_rank = np.empty(len(decades), dtype=np.int64)
+        dec_rank[dec_order] = np.arange(len(decades))
+        lemma_rank = np.empty(len(lemmas), dtype=np.int64)
+        lemma_rank[lemma_order] = np.arange(len(lemmas))
+        order = np.argsort(_pack(occ_file, dec_rank[occ_dec], lemma_rank[occ_lemma]))
+        return cls(files, decades.values[dec_order], lemmas.values[lemma_order], occ_file[order],
+                   dec_rank[occ_dec][order], lemma_rank[occ_lemma][order], occ_count[order])
+
+    # add the counts of further occurrences (e.g. of the rows appended to the list of occurrences, counted with from_chunks
+    # against the whole list of texts). The files of other must start with the files of these counts, i.e. new texts come
+    # after the known ones; the decades and the lemma vocabularies are merged (and sorted), and the counts of the same file,
+    # decade and lemma are added up. The result is the same as counting all occurrences at once.
+    def merge(self, other):
+        if len(other.files) < len(self.files) or list(other.files[:len(self.files)]) != list(self.files):
+            raise ValueError("the files of the merged counts must start with the files of these counts")
+        decades = pd.Index(self.decades).union(pd.Index(other.decades)).values
+        lemmas = np.union1d(self.lemmas.astype(str), other.lemmas.astype(str))
+        keys = [_pack(counts.occ_file, np.searchsorted(decades, counts.decades)[counts.occ_dec],
+                      np.searchsorted(lemmas, counts.lemmas.astype(str))[counts.occ_lemma]) for counts in (self, other)]
+        key, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        occ_count = np.bincount(inverse.ravel(), weights=np.concatenate((self.occ_count, other.occ_count)),
+                                minlength=len(key)).astype(np.int64)
+        occ_file, occ_dec, occ_lemma = _unpack(key)
+        return OccurrenceCounts(other.files, decades, lemmas.astype(object), occ_file, occ_dec, occ_lemma, occ_count)
+
+    # the same counts, summed over the decades: (file, lemma, count), sorted by file and lemma
+    def file_counts(self):
+        key, inverse = np.unique(self.occ_file * len(self.lemmas) + self.occ_lemma, return_inverse=True)
+        count = np.bincount(inverse.ravel(), weights=self.occ_count, minlength=len(key)).astype(np.int64)
+        return key // len(self.lemmas), key % len(self.lemmas), count
+
+    def save(self, path):
+        np.savez(path, files=np.asarray(self.files, dtype=str), decades=self.decades, lemmas=np.asarray(self.lemmas, dtype=str),
+                 occ_file=self.occ_file, occ_dec=self.occ_dec, occ_lemma=self.occ_lemma, occ_count=self.occ_count)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['files'].astype(object), data['decades'], data['lemmas'].astype(object), data['occ_file'],
+                       data['occ_dec'], data['occ_lemma'], data['occ_count'])
+
+
+# the following functions pack a file, a decade and a lemma code into one 64-bit key (and back):
+# up to 2^22 files, 2^10 decades and 2^31 lemmas
+def _pack(occ_file, occ_dec, occ_lemma):
+    return (np.asarray(occ_file, dtype=np.int64) << 41) | (np.asarray(occ_dec, dtype=np.int64) << 31) | np.asarray(occ_lemma, dtype=np.int64)
+
+
+def _unpack(key):
+    return key >> 41, (key >> 31) & ((1 << 10) - 1), key & ((1 << 31) - 1)
+
+
+class TextIndex:
+    # lemma_counts (optional): the number of occurrences of each entry of lemma_ids in its text
+    def __init__(self, texts, offsets, lemma_ids, lemmas, lemma_counts=None):
+        self.texts = texts.reset_index(drop=True)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lemma_ids = np.asarray(lemma_ids, dtype=np.int32)
+        self.lemmas = np.asarray(lemmas, dtype=object)
+        self.lemma_counts = None if lemma_counts is None else np.asarray(lemma_counts, dtype=np.int64)
+        self.nr_texts = len(self.texts)
+        self.nr_lemmas = len(self.lemmas)
+
+    # build the index from the list of texts and the counted occurrences (OccurrenceCounts.from_frames(texts, ...)).
+    # a file that appears in more than one row of texts gets the same lemmas in each of them.
+    @classmethod
+    def from_counts(cls, texts, counts):
+        file, lemma, count = counts.file_counts()
+        file_starts = np.searchsorted(file, np.arange(len(counts.files) + 1))
+        row_file = pd.Index(counts.files).get_indexer(texts['Datei'])
+        sizes = file_starts[row_file + 1] - file_starts[row_file]
+        offsets = np.zeros(len(row_file) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        # the position of each entry in the (file, lemma) list: the start of its file plus its rank within the text
+        entries = np.repeat(file_starts[row_file] - offsets[:-1], sizes) + np.arange(offsets[-1])
+        return cls(texts[['Datei', 'Dekade', 'Freq']], offsets, lemma[entries], counts.lemmas, count[entries])
+
+    # build the index from the list of texts and the list of occurrences (Dekade, Lemma, Datei)
+    @classmethod
+    def from_occurrences(cls, texts, occurrences):
+        return cls.from_counts(texts, OccurrenceCounts.from_frames(texts, occurrences))
+
+    # the text of each entry in lemma_ids
+    def pair_text(self):
+        return np.repeat(np.arange(self.nr_texts), np.diff(self.offsets))
+
+    # the set of lemmas of text t
+    def types(self, t):
+        return set(self.lemmas[self.lemma_ids[self.offsets[t]:self.offsets[t + 1]]])
+
+    # the index for the Säily simulations
+    def saily_index(self):
+        return saily_engine.SailyIndex(self.texts['Freq'].values, self.pair_text(), self.lemma_ids, self.lemmas)
+
+    # the number of running words per decade: a table with the decades as index and one column 'Freq'
+    def decade_tokens(self):
+        return self.texts.groupby('Dekade')[['Freq']].sum()
+
+    # the number of distinct lemmas (types) in each of the decades decs
+    def decade_types(self, decs):
+        decs = list(decs)
+        dec_code = pd.Index(decs).get_indexer(self.texts['Dekade'])[self.pair_text()]
+        selected = dec_code >= 0
+        pairs = np.unique(dec_code[selected].astype(np.int64) * self.nr_lemmas + self.lemma_ids[selected])
+        return np.bincount(pairs // self.nr_lemmas, minlength=len(decs))
+
+    def save(self, path):
+        np.savez(path, datei=np.asarray(self.texts['Datei'], dtype=str), dekade=np.asarray(self.texts['Dekade']),
+                 freq=np.asarray(self.texts['Freq']), offsets=self.offsets, lemma_ids=self.lemma_ids,
+                 lemmas=np.asarray(self.lemmas, dtype=str),
+                 **({} if self.lemma_counts is None else {'lemma_counts': self.lemma_counts}))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            texts = pd.DataFrame({'Datei': data['datei'].astype(object), 'Dekade': data['dekade'], 'Freq': data['freq']})
+            lemma_counts = data['lemma_counts'] if 'lemma_counts' in data.files else None
+            return cls(texts, data['offsets'], data['lemma_ids'], data['lemmas'].astype(object), lemma_counts)